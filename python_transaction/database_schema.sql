@@ -41,10 +41,36 @@ CREATE TABLE IF NOT EXISTS detalle_ventas (
     cantidad INT NOT NULL,
     precio_unitario DECIMAL(10, 2) NOT NULL,
     subtotal DECIMAL(10, 2) NOT NULL,
+    -- 0 = el descuento de stock aún no se escribió en productos (productos calientes)
+    stock_aplicado TINYINT(1) NOT NULL DEFAULT 1,
+    INDEX idx_detalle_stock_aplicado (stock_aplicado),
     FOREIGN KEY (venta_id) REFERENCES ventas(id),
     FOREIGN KEY (producto_id) REFERENCES productos(id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- Outbox transaccional: eventos de venta escritos en la misma transacción
+-- que la venta y publicados después por el relay (outbox_relay.py)
+CREATE TABLE IF NOT EXISTS outbox_eventos (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    venta_id INT NOT NULL,
+    tipo VARCHAR(50) NOT NULL,
+    payload JSON NOT NULL,
+    creado_en TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3),
+    publicado_en TIMESTAMP(3) NULL,
+    -- Plazo del relay que está publicando el evento (NULL = libre)
+    reclamado_hasta TIMESTAMP(3) NULL,
+    -- Publicaciones fallidas; al llegar a OUTBOX_MAX_INTENTOS el evento queda
+    -- aparcado hasta que se corrija y se vuelva a poner en 0
+    intentos INT NOT NULL DEFAULT 0,
+    INDEX idx_outbox_pendientes (publicado_en, id),
+    FOREIGN KEY (venta_id) REFERENCES ventas(id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Para bases de datos ya creadas:
+-- ALTER TABLE detalle_ventas
+--     ADD COLUMN stock_aplicado TINYINT(1) NOT NULL DEFAULT 1,
+--     ADD INDEX idx_detalle_stock_aplicado (stock_aplicado);
+
 -- Insertar algunos productos de ejemplo
 INSERT INTO productos (nombre, categoria, precio, stock) VALUES
 ('Arroz Blanco 1kg', 'Granos', 2.50, 100),
@@ -67,3 +93,14 @@ INSERT INTO clientes (nombre, email, telefono) VALUES
 -- 2. Permite rollback en caso de errores
 -- 3. Maneja bloqueo de registros para concurrencia
 -- 4. Garantiza la integridad referencial con foreign keys
+
+-- PRODUCTOS CALIENTES (HOT_PRODUCTS en .env):
+-- Sus ventas se admiten contra un contador en memoria y el stock se descuenta
+-- en lotes. detalle_ventas.stock_aplicado permite reconciliar al arrancar los
+-- descuentos que no llegaron a escribirse antes de una caída.
+
+-- VARIAS TIENDAS (SHARD_MAP en .env, ver shard_map.example.json):
+-- Cada tienda usa su propia base de datos con estas mismas tablas. Para
+-- probar en local, ejecute este script una vez por tienda cambiando el
+-- nombre de la base de datos, por ejemplo:
+--   sed 's/tienda_alimenticia/tienda_1/g' database_schema.sql | mysql -u root -p
@@ -0,0 +1,81 @@
+"""
+Importación masiva de datos a la tienda alimenticia
+
+Carga catálogo, clientes y ventas históricas desde archivos CSV (con
+encabezado) o NDJSON usando lotes de varias filas y varios workers en
+paralelo. Si la carga se interrumpe, basta con repetir el mismo comando
+para reanudarla desde el último checkpoint.
+
+Uso:
+    python importar_datos.py productos=productos.csv clientes=clientes.ndjson \\
+        ventas=ventas.csv detalle_ventas=detalle.csv --workers 4 --lote 2000
+
+Opciones:
+    --modo load-data        Usa LOAD DATA LOCAL INFILE (requiere local_infile=1 en el servidor)
+    --sin-verificaciones    Desactiva foreign_key_checks y unique_checks en la sesión de carga
+                            (solo con datos ya consistentes)
+    --reiniciar             Ignora los checkpoints existentes
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+from src.bulk_loader import BulkLoader, ORDEN_CARGA, MODOS
+
+def main():
+    """
+    Función principal de la importación
+    """
+    load_dotenv()
+    
+    parser = argparse.ArgumentParser(description="Importación masiva de datos")
+    parser.add_argument('archivos', nargs='+', help="tabla=ruta (productos, clientes, ventas, detalle_ventas)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--lote', type=int, default=1000)
+    parser.add_argument('--modo', choices=MODOS, default='insert')
+    parser.add_argument('--sin-verificaciones', action='store_true')
+    parser.add_argument('--reiniciar', action='store_true')
+    args = parser.parse_args()
+    
+    archivos = {}
+    for argumento in args.archivos:
+        tabla, _, ruta = argumento.partition('=')
+        if tabla not in ORDEN_CARGA or not ruta:
+            parser.error(f"Argumento inválido '{argumento}'. Use tabla=ruta con tabla en {ORDEN_CARGA}")
+        archivos[tabla] = ruta
+    
+    print("=" * 60)
+    print("📥 IMPORTACIÓN MASIVA - TIENDA ALIMENTICIA")
+    print("=" * 60)
+    
+    resultados = []
+    for tabla in ORDEN_CARGA:
+        if tabla not in archivos:
+            continue
+        
+        loader = BulkLoader(
+            tabla,
+            archivos[tabla],
+            tamano_lote=args.lote,
+            workers=args.workers,
+            modo=args.modo,
+            sin_verificaciones=args.sin_verificaciones,
+            reiniciar=args.reiniciar
+        )
+        try:
+            resultados.append(loader.cargar())
+        except Exception as e:
+            print(f"❌ Importación detenida en {tabla}: {e}")
+            sys.exit(1)
+    
+    print()
+    print("📊 RESUMEN:")
+    for resultado in resultados:
+        print(f"   {resultado['tabla']}: {resultado['registros']} registros en "
+              f"{resultado['segundos']}s ({resultado['registros_por_segundo']:,.0f} registros/s)")
+
+if __name__ == "__main__":
+    main()
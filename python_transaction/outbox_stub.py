@@ -0,0 +1,48 @@
+"""
+Stub HTTP local para recibir los eventos del outbox
+
+Sirve para probar HttpSink sin un sistema externo real: imprime cada lote
+recibido y responde 200. Con --fallar responde 503 para ver los reintentos.
+
+Uso:
+    python outbox_stub.py [--puerto 5001] [--fallar]
+"""
+
+import json
+import argparse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+def crear_handler(fallar):
+    class OutboxStubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            longitud = int(self.headers.get('Content-Length', 0))
+            datos = json.loads(self.rfile.read(longitud) or b'{}')
+            eventos = datos.get('eventos', [])
+            
+            if fallar:
+                print(f"💥 Rechazando lote de {len(eventos)} evento(s)")
+                self.send_response(503)
+                self.end_headers()
+                return
+            
+            for evento in eventos:
+                print(f"📨 Evento {evento['id']} ({evento['tipo']}) - venta {evento['venta_id']}")
+            self.send_response(200)
+            self.end_headers()
+    
+    return OutboxStubHandler
+
+def main():
+    """
+    Función principal del stub
+    """
+    parser = argparse.ArgumentParser(description="Stub HTTP para eventos del outbox")
+    parser.add_argument('--puerto', type=int, default=5001)
+    parser.add_argument('--fallar', action='store_true')
+    args = parser.parse_args()
+    
+    print(f"🔗 Escuchando eventos en http://localhost:{args.puerto}/eventos")
+    HTTPServer(('localhost', args.puerto), crear_handler(args.fallar)).serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Reporte de consultas SQL del servicio ordenadas por tiempo total
+
+Lee las estadísticas que guarda el monitor de consultas (QUERY_STATS_FILE)
+y marca las sentencias cuyo EXPLAIN mostró un escaneo completo de tabla.
+
+Uso:
+    python reporte_consultas.py [archivo_estadisticas] [--limite N]
+"""
+
+import sys
+import os
+import json
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+from src.query_monitor import generar_reporte
+
+def main():
+    """
+    Función principal del reporte
+    """
+    load_dotenv()
+    
+    parser = argparse.ArgumentParser(description="Reporte de consultas SQL lentas")
+    parser.add_argument('archivo', nargs='?', default=os.getenv('QUERY_STATS_FILE', 'query_stats.json'))
+    parser.add_argument('--limite', type=int, default=20)
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.archivo):
+        print(f"❌ No existe el archivo de estadísticas: {args.archivo}")
+        print("🔧 Active QUERY_MONITOR=True en .env y ejecute la aplicación")
+        return
+    
+    with open(args.archivo, encoding='utf-8') as archivo:
+        datos = json.load(archivo)
+    
+    consultas = datos.get('consultas', [])
+    print("=" * 60)
+    print("📊 CONSULTAS SQL ORDENADAS POR TIEMPO TOTAL")
+    print("=" * 60)
+    print(generar_reporte(consultas, limite=args.limite))
+    
+    escaneos = [c for c in consultas if c['escaneo_completo']]
+    print()
+    if escaneos:
+        print(f"⚠️  {len(escaneos)} sentencia(s) con escaneo completo de tabla:")
+        for consulta in escaneos:
+            print(f"   • {consulta['sql']}")
+    else:
+        print("✅ Ninguna sentencia explicada hace escaneo completo de tabla")
+
+if __name__ == "__main__":
+    main()
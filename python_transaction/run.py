@@ -14,7 +14,7 @@ sys.path.insert(0, str(PROJECT_DIR))
 # Cambiar al directorio del proyecto
 os.chdir(PROJECT_DIR)
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -22,7 +22,14 @@ load_dotenv()
 
 # Importar servicios del proyecto
 from src.services.transaction_service import TransactionService
+from src.services.stock_ledger import HotStockLedger
+from src.services.stock_broadcaster import StockBroadcaster
+from src.services.shard_router import ShardRouter
+from src.services.outbox_relay import OutboxRelay, metricas_combinadas
 from src.database import Database
+from src.profiler import RequestProfiler
+from src.query_monitor import QueryMonitor
+from src.admission import AdmissionController, CircuitoAbiertoError, PRIORIDAD_ALTA, PRIORIDAD_BAJA
 
 # Configurar rutas de templates y static
 template_dir = PROJECT_DIR / 'templates'
@@ -34,21 +41,97 @@ app = Flask(__name__,
            static_folder=str(static_dir))
 app.secret_key = os.getenv('SECRET_KEY', 'clave_secreta_por_defecto')
 
+# Perfilado bajo demanda de peticiones (ver src/profiler.py)
+profiler = RequestProfiler.desde_entorno()
+profiler.registrar(app)
+
+# Control de admisión y circuit breaker delante de la base de datos
+admision = AdmissionController.desde_entorno()
+admision.registrar(app)
+
 # Inicializar servicios
-transaction_service = TransactionService()
+# Los hilos de fondo de estos servicios arrancan en iniciar_servicios_de_fondo()
+# Ledger opcional para productos calientes (HOT_PRODUCTS en .env)
+stock_ledger = HotStockLedger.desde_entorno(db=admision.breaker.proteger(Database()))
+
+# Difusor de cambios de stock para /stream/stock
+stock_broadcaster = StockBroadcaster()
+
+# Monitor opcional de consultas lentas (QUERY_MONITOR en .env)
+query_monitor = QueryMonitor.desde_entorno()
+
+# Outbox de eventos de venta (OUTBOX en .env); los relays se crean más abajo
+outbox_habilitado = os.getenv('OUTBOX', 'False').lower() == 'true'
+
+transaction_service = TransactionService(
+    db=admision.breaker.proteger(Database()),
+    stock_ledger=stock_ledger,
+    broadcaster=stock_broadcaster,
+    query_monitor=query_monitor,
+    outbox=outbox_habilitado
+)
 db = Database()
 
+# Mapa opcional de tiendas -> bases de datos (SHARD_MAP en .env)
+shard_map_path = os.getenv('SHARD_MAP', '').strip()
+shard_router = ShardRouter.desde_archivo(
+    shard_map_path,
+    proteger=admision.proteger,
+    broadcaster=stock_broadcaster,
+    query_monitor=query_monitor,
+    outbox=outbox_habilitado
+) if shard_map_path else None
+if shard_router and stock_ledger:
+    print("⚠️  HOT_PRODUCTS solo aplica a la base por defecto, no a las tiendas de SHARD_MAP")
+
+# Un relay por base de datos con outbox: la por defecto y la de cada tienda
+outbox_relays = []
+if outbox_habilitado:
+    outbox_sinks = OutboxRelay.sinks_desde_entorno()
+    outbox_relays.append(OutboxRelay.desde_entorno(db=admision.breaker.proteger(Database()), sinks=outbox_sinks))
+    if shard_router:
+        outbox_relays.extend(shard_router.relays_outbox(outbox_sinks))
+
+def iniciar_servicios_de_fondo():
+    """
+    Arranca los hilos de fondo (ledger, monitor de consultas, relay de outbox)
+
+    Solo debe llamarse en el proceso que atiende peticiones. Con el recargador
+    de Flask (debug) el proceso padre solo vigila archivos: si también los
+    arrancara duplicaría el flush del ledger y el relay, y al salir
+    sobrescribiría QUERY_STATS_FILE con estadísticas vacías. Con un servidor
+    WSGI se llama después de importar la aplicación.
+    """
+    if stock_ledger:
+        stock_ledger.iniciar()
+    if query_monitor:
+        query_monitor.iniciar()
+    for relay in outbox_relays:
+        relay.iniciar()
+
+def servicio_para(tienda_id):
+    """
+    Devuelve el servicio de la tienda indicada o el servicio por defecto
+    """
+    if tienda_id is None or shard_router is None:
+        return transaction_service
+    return shard_router.servicio(tienda_id)
+
 @app.route('/')
+@admision.controlar(PRIORIDAD_BAJA)
 def index():
     """
     Página principal de la tienda
     """
+    # Secuencia tomada ANTES de leer: el snapshot incluye al menos esos eventos
+    stock_seq = stock_broadcaster.secuencia
     productos = transaction_service.obtener_productos()
     clientes = transaction_service.obtener_clientes()
     
-    return render_template('index.html', productos=productos, clientes=clientes)
+    return render_template('index.html', productos=productos, clientes=clientes, stock_seq=stock_seq)
 
 @app.route('/realizar_venta', methods=['POST'])
+@admision.controlar(PRIORIDAD_ALTA)
 def realizar_venta():
     """
     Endpoint para realizar una venta con transacciones
@@ -57,6 +140,7 @@ def realizar_venta():
         data = request.get_json()
         cliente_id = data.get('cliente_id')
         items = data.get('items', [])
+        tienda_id = data.get('tienda_id')
         
         if not cliente_id:
             return jsonify({"success": False, "error": "Debe seleccionar un cliente"})
@@ -64,15 +148,20 @@ def realizar_venta():
         if not items:
             return jsonify({"success": False, "error": "Debe agregar productos a la venta"})
         
-        # Realizar la venta usando transacciones
-        resultado = transaction_service.realizar_venta_con_transaccion(cliente_id, items)
+        # Realizar la venta usando transacciones (en la base de datos de la tienda)
+        resultado = servicio_para(tienda_id).realizar_venta_con_transaccion(cliente_id, items)
         
         return jsonify(resultado)
         
+    except CircuitoAbiertoError:
+        # Lo convierte en 503 el manejador registrado por AdmissionController
+        raise
+        
     except Exception as e:
         return jsonify({"success": False, "error": f"Error interno: {str(e)}"})
 
 @app.route('/simular_error', methods=['POST'])
+@admision.controlar(PRIORIDAD_BAJA)
 def simular_error():
     """
     Endpoint para simular una transacción con error (para demostrar rollback)
@@ -87,25 +176,72 @@ def simular_error():
         
         return jsonify(resultado)
         
+    except CircuitoAbiertoError:
+        raise
+        
     except Exception as e:
         return jsonify({"success": False, "error": f"Error interno: {str(e)}"})
 
 @app.route('/productos')
+@admision.controlar(PRIORIDAD_BAJA)
 def obtener_productos():
     """
     API para obtener la lista de productos
     """
-    productos = transaction_service.obtener_productos()
-    return jsonify(productos)
+    try:
+        servicio = servicio_para(request.args.get('tienda_id'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    stock_seq = stock_broadcaster.secuencia
+    productos = servicio.obtener_productos()
+    respuesta = jsonify(productos)
+    # Secuencia del snapshot para que el cliente descarte valores viejos
+    respuesta.headers['X-Stock-Seq'] = str(stock_seq)
+    return respuesta
 
 @app.route('/clientes')
+@admision.controlar(PRIORIDAD_BAJA)
 def obtener_clientes():
     """
     API para obtener la lista de clientes
     """
-    clientes = transaction_service.obtener_clientes()
+    try:
+        servicio = servicio_para(request.args.get('tienda_id'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    clientes = servicio.obtener_clientes()
     return jsonify(clientes)
 
+@app.route('/reportes/ventas')
+@admision.controlar(PRIORIDAD_BAJA)
+def reporte_ventas():
+    """
+    Reporte de ventas combinado de todas las tiendas (scatter-gather)
+    """
+    if shard_router is None:
+        return jsonify({"success": False, "error": "No hay mapa de shards configurado (SHARD_MAP)"}), 404
+    return jsonify(shard_router.reporte_ventas())
+
+@app.route('/stream/stock')
+def stream_stock():
+    """
+    Server-Sent Events con los cambios de stock confirmados
+    """
+    return Response(
+        stock_broadcaster.stream(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/outbox/metricas')
+def metricas_outbox():
+    """
+    Retraso y contadores del relay de eventos de venta
+    """
+    if not outbox_relays:
+        return jsonify({"success": False, "error": "El outbox no está habilitado (OUTBOX)"}), 404
+    return jsonify(metricas_combinadas(outbox_relays))
+
 @app.route('/test_db')
 def test_database():
     """
@@ -165,6 +301,11 @@ def main():
         port = int(os.getenv('PORT', 5000))
         debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
         
+        # Con debug, el recargador vuelve a ejecutar este script en un proceso
+        # hijo (WERKZEUG_RUN_MAIN=true) que es el que atiende las peticiones
+        if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            iniciar_servicios_de_fondo()
+        
         # Iniciar la aplicación Flask
         app.run(host='0.0.0.0', port=port, debug=debug)
         
@@ -0,0 +1,255 @@
+"""
+Control de admisión y circuit breaker delante de la base de datos
+
+Cuando MySQL se pone lento, cada hilo de Flask se queda esperando dentro
+de realizar_venta_con_transaccion (conexiones, bloqueos) y la latencia
+crece sin límite hasta que todo vence a la vez. Este módulo:
+
+- Limita las peticiones concurrentes que llegan a la base de datos. El
+  límite se adapta a la latencia observada (AIMD): sube de a poco mientras
+  las peticiones terminan dentro de la latencia objetivo y baja
+  multiplicativamente cuando la superan, una sola vez por ventana: las
+  peticiones que ya estaban en curso al bajar el límite no lo vuelven a bajar.
+- Da prioridad a /realizar_venta: el tráfico de listados solo puede usar
+  una parte del límite, el resto queda reservado para las ventas.
+- Rechaza al instante con 503 y Retry-After cuando no hay cupo, en lugar
+  de encolar peticiones que igual vencerían.
+- Protege Database.get_connection() con un circuit breaker: tras varios
+  fallos seguidos deja de intentar conectar durante un tiempo para que la
+  base de datos se recupere, y luego deja pasar una sola petición de prueba.
+  Las bases de las tiendas (SHARD_MAP) tienen cada una su propio breaker;
+  la ruta responde 503 solo si el breaker de la base que usa está abierto.
+"""
+
+import os
+import time
+import threading
+from functools import wraps
+from flask import jsonify
+
+PRIORIDAD_ALTA = 'alta'
+PRIORIDAD_BAJA = 'baja'
+
+
+class CircuitoAbiertoError(Exception):
+    """
+    La base de datos está en recuperación y no se intentan nuevas conexiones
+    """
+
+    def __init__(self, segundos_restantes):
+        super().__init__("La base de datos está en recuperación, intente más tarde")
+        self.segundos_restantes = segundos_restantes
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de tres estados: cerrado, abierto y semiabierto
+    """
+
+    CERRADO = 'cerrado'
+    ABIERTO = 'abierto'
+    SEMIABIERTO = 'semiabierto'
+
+    def __init__(self, umbral_fallos=5, segundos_abierto=10):
+        self.umbral_fallos = umbral_fallos
+        self.segundos_abierto = segundos_abierto
+        self.estado = self.CERRADO
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._sonda_en_curso = False
+        self._lock = threading.Lock()
+
+    def segundos_restantes(self):
+        with self._lock:
+            return self._segundos_restantes()
+
+    def _segundos_restantes(self):
+        return max(0.0, self._abierto_desde + self.segundos_abierto - time.monotonic())
+
+    def permite(self):
+        """
+        Decide si se puede intentar una conexión ahora
+        """
+        with self._lock:
+            if self.estado == self.CERRADO:
+                return True
+            if self.estado == self.ABIERTO and self._segundos_restantes() > 0:
+                return False
+
+            # Tiempo cumplido: una sola petición de prueba
+            self.estado = self.SEMIABIERTO
+            if self._sonda_en_curso:
+                return False
+            self._sonda_en_curso = True
+            return True
+
+    def registrar_exito(self):
+        with self._lock:
+            if self.estado != self.CERRADO:
+                print("✅ Circuit breaker cerrado: la base de datos respondió")
+            self.estado = self.CERRADO
+            self._fallos = 0
+            self._sonda_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._sonda_en_curso = False
+            if self.estado == self.SEMIABIERTO or self._fallos >= self.umbral_fallos:
+                self.estado = self.ABIERTO
+                self._abierto_desde = time.monotonic()
+                print(f"⛔ Circuit breaker abierto por {self.segundos_abierto}s tras {self._fallos} fallo(s)")
+
+    def proteger(self, db):
+        return DatabaseProtegida(db, self)
+
+
+class DatabaseProtegida:
+    """
+    Envoltura de Database cuyo get_connection() pasa por el circuit breaker
+    """
+
+    def __init__(self, db, breaker):
+        self._db = db
+        self._breaker = breaker
+
+    def get_connection(self):
+        if not self._breaker.permite():
+            raise CircuitoAbiertoError(self._breaker.segundos_restantes())
+
+        try:
+            connection = self._db.get_connection()
+        except Exception:
+            self._breaker.registrar_fallo()
+            raise
+
+        if not connection:
+            self._breaker.registrar_fallo()
+            return None
+
+        self._breaker.registrar_exito()
+        return connection
+
+    def __getattr__(self, nombre):
+        return getattr(self._db, nombre)
+
+
+class AdaptiveLimiter:
+    """
+    Límite de concurrencia que se adapta a la latencia (AIMD)
+    """
+
+    def __init__(self, limite_inicial=20, limite_minimo=2, limite_maximo=200,
+                 latencia_objetivo=0.5, reserva_alta=0.2):
+        self.limite = float(limite_inicial)
+        self.limite_minimo = limite_minimo
+        self.limite_maximo = limite_maximo
+        self.latencia_objetivo = latencia_objetivo
+        # Fracción del límite que el tráfico de baja prioridad no puede usar
+        self.reserva_alta = reserva_alta
+        self.en_curso = 0
+        self._ultima_reduccion = float('-inf')
+        self._lock = threading.Lock()
+
+    def intentar_adquirir(self, prioridad):
+        with self._lock:
+            capacidad = int(self.limite)
+            if prioridad != PRIORIDAD_ALTA:
+                capacidad = max(1, int(self.limite * (1 - self.reserva_alta)))
+            if self.en_curso >= capacidad:
+                return False
+            self.en_curso += 1
+            return True
+
+    def liberar(self, latencia, exito=True):
+        ahora = time.monotonic()
+        with self._lock:
+            self.en_curso -= 1
+            if not exito or latencia > self.latencia_objetivo:
+                # Las peticiones que empezaron antes de la última reducción ya se vieron reflejadas en ella
+                if ahora - latencia >= self._ultima_reduccion:
+                    self.limite = max(self.limite_minimo, self.limite * 0.9)
+                    self._ultima_reduccion = ahora
+            else:
+                # Aproximadamente +1 por cada "ventana" completa de peticiones
+                self.limite = min(self.limite_maximo, self.limite + 1 / self.limite)
+
+    def descartar(self):
+        """
+        Libera el cupo sin ajustar el límite (la petición no llegó a la base)
+        """
+        with self._lock:
+            self.en_curso -= 1
+
+
+class AdmissionController:
+    """
+    Aplica el limitador y el circuit breaker a las rutas de Flask
+    """
+
+    def __init__(self, limiter, breaker, retry_after=1):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.retry_after = retry_after
+
+    @classmethod
+    def desde_entorno(cls):
+        limiter = AdaptiveLimiter(
+            limite_inicial=int(os.getenv('ADMISSION_LIMITE_INICIAL', 20)),
+            limite_maximo=int(os.getenv('ADMISSION_LIMITE_MAXIMO', 200)),
+            latencia_objetivo=float(os.getenv('ADMISSION_LATENCIA_OBJETIVO_MS', 500)) / 1000
+        )
+        breaker = CircuitBreaker(
+            umbral_fallos=int(os.getenv('BREAKER_UMBRAL_FALLOS', 5)),
+            segundos_abierto=float(os.getenv('BREAKER_SEGUNDOS_ABIERTO', 10))
+        )
+        return cls(limiter, breaker)
+
+    def proteger(self, db):
+        """
+        Protege otra base de datos con un breaker propio, configurado como el principal
+
+        Así la caída de la base de una tienda no corta las ventas de las demás.
+        """
+        breaker = CircuitBreaker(self.breaker.umbral_fallos, self.breaker.segundos_abierto)
+        return breaker.proteger(db)
+
+    def registrar(self, app):
+        """
+        Convierte CircuitoAbiertoError en 503 para las rutas que no lo capturan
+        """
+        @app.errorhandler(CircuitoAbiertoError)
+        def circuito_abierto(error):
+            return self.rechazar(str(error), error.segundos_restantes)
+
+    def rechazar(self, mensaje, segundos):
+        respuesta = jsonify({"success": False, "error": mensaje})
+        respuesta.status_code = 503
+        respuesta.headers['Retry-After'] = str(max(1, int(round(segundos))))
+        return respuesta
+
+    def controlar(self, prioridad=PRIORIDAD_BAJA):
+        """
+        Decorador para las rutas que llegan a la base de datos
+        """
+        def decorador(vista):
+            @wraps(vista)
+            def envoltura(*args, **kwargs):
+                # El breaker se consulta al pedir la conexión a la base que usa la ruta
+                if not self.limiter.intentar_adquirir(prioridad):
+                    return self.rechazar("Servidor ocupado, intente nuevamente", self.retry_after)
+
+                inicio = time.monotonic()
+                try:
+                    respuesta = vista(*args, **kwargs)
+                except CircuitoAbiertoError:
+                    # Rechazo del breaker, no una medida de la base de datos
+                    self.limiter.descartar()
+                    raise
+                except Exception:
+                    self.limiter.liberar(time.monotonic() - inicio, exito=False)
+                    raise
+                self.limiter.liberar(time.monotonic() - inicio)
+                return respuesta
+            return envoltura
+        return decorador
@@ -0,0 +1,379 @@
+"""
+Carga masiva de catálogo, clientes y ventas históricas
+
+Insertar fila por fila un catálogo real o años de ventas tarda horas: cada
+INSERT es un viaje de ida y vuelta y un commit. Este cargador:
+- Lee el archivo en streaming (CSV con encabezado o NDJSON), sin cargarlo
+  completo en memoria.
+- Agrupa las filas en lotes y los inserta con un solo INSERT de varias filas
+  (modo "insert") o con LOAD DATA LOCAL INFILE (modo "load-data").
+- Reparte los lotes entre varios workers, cada uno con su propia conexión.
+- Opcionalmente desactiva foreign_key_checks y unique_checks en la sesión
+  de carga. Solo es seguro con datos ya consistentes (por ejemplo, una
+  exportación de otra base): MySQL no vuelve a validar esas filas.
+- Guarda un checkpoint con los registros confirmados de forma contigua y
+  los lotes posteriores que ya se confirmaron. Al reanudar se saltan
+  exactamente esos registros, así que cualquier conflicto de clave (por
+  ejemplo con los datos de ejemplo de database_schema.sql) o valor inválido
+  detiene la carga en lugar de descartarse en silencio.
+- Cada registro debe traer su columna id; una clave desconocida es un
+  error y una clave ausente (NDJSON) se carga como NULL.
+
+Las tablas se cargan en orden de dependencias (productos, clientes, ventas,
+detalle_ventas), de modo que las filas padre ya están confirmadas cuando se
+cargan las hijas.
+"""
+
+import os
+import csv
+import json
+import time
+import queue
+import tempfile
+import threading
+import mysql.connector
+from mysql.connector import Error
+
+# Columnas que se aceptan para cada tabla
+TABLAS = {
+    'productos': ['id', 'nombre', 'categoria', 'precio', 'stock', 'fecha_creacion'],
+    'clientes': ['id', 'nombre', 'email', 'telefono', 'fecha_registro'],
+    'ventas': ['id', 'cliente_id', 'fecha_venta', 'total', 'estado'],
+    'detalle_ventas': ['id', 'venta_id', 'producto_id', 'cantidad', 'precio_unitario', 'subtotal', 'stock_aplicado'],
+}
+
+# Orden de carga respetando las foreign keys
+ORDEN_CARGA = ['productos', 'clientes', 'ventas', 'detalle_ventas']
+
+MODOS = ('insert', 'load-data')
+
+
+def leer_registros(ruta):
+    """
+    Recorre el archivo registro a registro (CSV con encabezado o NDJSON)
+    """
+    if ruta.endswith(('.ndjson', '.jsonl')):
+        with open(ruta, encoding='utf-8') as archivo:
+            for linea in archivo:
+                if linea.strip():
+                    yield json.loads(linea)
+    else:
+        with open(ruta, encoding='utf-8', newline='') as archivo:
+            for fila in csv.DictReader(archivo):
+                # En CSV la celda vacía representa NULL
+                yield {k: (v if v != '' else None) for k, v in fila.items()}
+
+
+class _Checkpoint:
+    """
+    Marca de registros confirmados de forma contigua desde el inicio del
+    archivo, más los lotes posteriores que ya se confirmaron
+    """
+
+    def __init__(self, ruta, tabla, archivo):
+        self.ruta = ruta
+        self.tabla = tabla
+        self.archivo = archivo
+        self.confirmados = 0
+        self.completado = False
+        self._terminados = {}  # inicio_lote -> cantidad, aún no contiguos
+        self._lock = threading.Lock()
+
+    def cargar(self):
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, encoding='utf-8') as archivo:
+            datos = json.load(archivo)
+        if datos.get('tabla') == self.tabla and datos.get('archivo') == self.archivo:
+            self.confirmados = datos.get('registros_confirmados', 0)
+            self.completado = datos.get('completado', False)
+            self._terminados = {inicio: cantidad for inicio, cantidad in datos.get('lotes_terminados', [])}
+
+    def rangos_terminados(self):
+        """
+        Rangos [inicio, fin) de registros confirmados después de la marca contigua
+        """
+        with self._lock:
+            return sorted((inicio, inicio + cantidad) for inicio, cantidad in self._terminados.items())
+
+    def lote_terminado(self, inicio, cantidad):
+        with self._lock:
+            self._terminados[inicio] = cantidad
+            while self.confirmados in self._terminados:
+                self.confirmados += self._terminados.pop(self.confirmados)
+            self._guardar()
+
+    def marcar_completado(self):
+        with self._lock:
+            self.completado = True
+            self._guardar()
+
+    def _guardar(self):
+        temporal = f"{self.ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump({
+                'tabla': self.tabla,
+                'archivo': self.archivo,
+                'registros_confirmados': self.confirmados,
+                'lotes_terminados': sorted([inicio, cantidad] for inicio, cantidad in self._terminados.items()),
+                'completado': self.completado
+            }, archivo)
+        os.replace(temporal, self.ruta)
+
+
+class BulkLoader:
+    """
+    Cargador masivo de una tabla a partir de un archivo
+    """
+
+    def __init__(self, tabla, ruta, tamano_lote=1000, workers=4, modo='insert',
+                 sin_verificaciones=False, ruta_checkpoint=None, reiniciar=False):
+        if tabla not in TABLAS:
+            raise ValueError(f"Tabla no soportada: {tabla}")
+        if modo not in MODOS:
+            raise ValueError(f"Modo no soportado: {modo}")
+
+        self.tabla = tabla
+        self.ruta = ruta
+        self.tamano_lote = tamano_lote
+        self.workers = max(1, workers)
+        self.modo = modo
+        self.sin_verificaciones = sin_verificaciones
+        self.checkpoint = _Checkpoint(
+            ruta_checkpoint or f"{ruta}.checkpoint.json",
+            tabla,
+            os.path.abspath(ruta)
+        )
+        if not reiniciar:
+            self.checkpoint.cargar()
+
+        self.insertados = 0
+        self._lock = threading.Lock()
+        self._error = None
+
+    def _conectar(self):
+        """
+        Conexión propia para cada worker, con las opciones de la sesión de carga
+        """
+        connection = mysql.connector.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=int(os.getenv('DB_PORT', 3306)),
+            database=os.getenv('DB_NAME', 'tienda_alimenticia'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', ''),
+            allow_local_infile=self.modo == 'load-data',
+            autocommit=False
+        )
+        if self.sin_verificaciones:
+            cursor = connection.cursor()
+            cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+            cursor.close()
+        return connection
+
+    def cargar(self):
+        """
+        Ejecuta la carga completa (o la reanuda desde el checkpoint)
+
+        Returns:
+            dict: Registros insertados, segundos y registros por segundo
+        """
+        if self.checkpoint.completado:
+            print(f"⏭️  {self.tabla}: ya cargada según el checkpoint ({self.checkpoint.confirmados} registros)")
+            return {'tabla': self.tabla, 'registros': 0, 'segundos': 0.0, 'registros_por_segundo': 0.0}
+
+        saltar = self.checkpoint.confirmados
+        rangos = self.checkpoint.rangos_terminados()
+        if saltar or rangos:
+            print(f"🔁 {self.tabla}: reanudando después de {saltar} registros confirmados "
+                  f"(más {sum(fin - inicio for inicio, fin in rangos)} en lotes posteriores)")
+
+        cola = queue.Queue(maxsize=self.workers * 2)
+        hilos = [
+            threading.Thread(target=self._worker, args=(cola,), name=f"loader-{self.tabla}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for hilo in hilos:
+            hilo.start()
+
+        inicio = time.perf_counter()
+        ultimo_reporte = inicio
+        lote = []
+        inicio_lote = saltar
+        indice_rango = 0
+
+        try:
+            for posicion, registro in enumerate(leer_registros(self.ruta)):
+                if self._error:
+                    break
+                if posicion < saltar:
+                    continue
+
+                # Registros de un lote ya confirmado en una ejecución anterior
+                while indice_rango < len(rangos) and rangos[indice_rango][1] <= posicion:
+                    indice_rango += 1
+                if indice_rango < len(rangos) and rangos[indice_rango][0] <= posicion:
+                    # Cada lote cubre registros contiguos: se cierra el actual
+                    if lote:
+                        self._encolar(cola, inicio_lote, lote)
+                        lote = []
+                    continue
+
+                self._validar(registro, posicion)
+                if not lote:
+                    inicio_lote = posicion
+                lote.append(registro)
+                if len(lote) >= self.tamano_lote:
+                    self._encolar(cola, inicio_lote, lote)
+                    lote = []
+
+                ahora = time.perf_counter()
+                if ahora - ultimo_reporte >= 2:
+                    self._reportar(ahora - inicio)
+                    ultimo_reporte = ahora
+
+            if lote and not self._error:
+                self._encolar(cola, inicio_lote, lote)
+        finally:
+            # Un marcador de fin por worker
+            for _ in hilos:
+                cola.put(None)
+            for hilo in hilos:
+                hilo.join()
+
+        segundos = time.perf_counter() - inicio
+        if self._error:
+            print(f"❌ {self.tabla}: carga interrumpida. Reanude con el mismo comando ({self.checkpoint.confirmados} registros confirmados)")
+            raise self._error
+
+        self.checkpoint.marcar_completado()
+        self._reportar(segundos, final=True)
+        return {
+            'tabla': self.tabla,
+            'registros': self.insertados,
+            'segundos': round(segundos, 2),
+            'registros_por_segundo': round(self.insertados / segundos, 1) if segundos else 0.0
+        }
+
+    def _validar(self, registro, posicion):
+        desconocidas = set(registro) - set(TABLAS[self.tabla])
+        if desconocidas:
+            raise ValueError(
+                f"Columnas desconocidas en {self.tabla} (registro {posicion + 1}): {', '.join(sorted(desconocidas))}"
+            )
+        if registro.get('id') is None:
+            raise ValueError(f"El registro {posicion + 1} de {self.tabla} no tiene 'id' (necesario para reanudar)")
+
+    def _encolar(self, cola, inicio_lote, registros):
+        """
+        Envía el lote a los workers con las columnas presentes en sus registros
+        """
+        columnas = [c for c in TABLAS[self.tabla] if any(c in registro for registro in registros)]
+        filas = [tuple(registro.get(c) for c in columnas) for registro in registros]
+        cola.put((inicio_lote, columnas, filas))
+
+    def _reportar(self, segundos, final=False):
+        velocidad = self.insertados / segundos if segundos else 0
+        icono = "✅" if final else "⏳"
+        print(f"{icono} {self.tabla}: {self.insertados} registros en {segundos:.1f}s ({velocidad:,.0f} registros/s)")
+
+    def _worker(self, cola):
+        connection = None
+        try:
+            connection = self._conectar()
+            cursor = connection.cursor()
+            while True:
+                trabajo = cola.get()
+                if trabajo is None:
+                    break
+                if self._error:
+                    continue
+
+                inicio_lote, columnas, filas = trabajo
+                if self.modo == 'load-data':
+                    self._load_data(cursor, columnas, filas)
+                else:
+                    self._insertar(cursor, columnas, filas)
+                connection.commit()
+
+                with self._lock:
+                    self.insertados += len(filas)
+                self.checkpoint.lote_terminado(inicio_lote, len(filas))
+            cursor.close()
+
+        except (Error, OSError) as e:
+            print(f"❌ Error en la carga de {self.tabla}: {e}")
+            if connection:
+                connection.rollback()
+            self._error = e
+            # Vaciar la cola para no bloquear al lector
+            while True:
+                try:
+                    if cola.get_nowait() is None:
+                        break
+                except queue.Empty:
+                    time.sleep(0.05)
+        finally:
+            if connection:
+                connection.close()
+
+    def _insertar(self, cursor, columnas, filas):
+        """
+        Un único INSERT de varias filas; un conflicto de clave detiene la carga
+        """
+        marcadores = '(' + ', '.join(['%s'] * len(columnas)) + ')'
+        valores = ', '.join([marcadores] * len(filas))
+        parametros = [valor for fila in filas for valor in fila]
+
+        cursor.execute(f"INSERT INTO {self.tabla} ({', '.join(columnas)}) VALUES {valores}", parametros)
+        self._verificar_filas(cursor, len(filas))
+
+    def _load_data(self, cursor, columnas, filas):
+        """
+        LOAD DATA LOCAL INFILE del lote escrito en un archivo temporal
+
+        Con LOCAL el servidor no puede cortar la transferencia y trata los
+        duplicados y los errores de conversión como advertencias (igual que
+        IGNORE), así que se verifican las filas y advertencias del lote.
+        """
+        descriptor, temporal = tempfile.mkstemp(suffix='.csv', prefix=f"carga_{self.tabla}_")
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8', newline='') as archivo:
+                for fila in filas:
+                    archivo.write(','.join(self._campo_load_data(valor) for valor in fila) + '\n')
+
+            cursor.execute(
+                f"""LOAD DATA LOCAL INFILE %s INTO TABLE {self.tabla}
+                    CHARACTER SET utf8mb4
+                    FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+                    LINES TERMINATED BY '\\n'
+                    ({', '.join(columnas)})""",
+                (temporal,)
+            )
+            self._verificar_filas(cursor, len(filas))
+        finally:
+            os.remove(temporal)
+
+    @staticmethod
+    def _verificar_filas(cursor, esperadas):
+        """
+        Falla si el lote no insertó todas sus filas o dejó advertencias
+
+        Las advertencias incluyen filas duplicadas descartadas y valores
+        truncados o convertidos; el worker hace rollback del lote.
+        """
+        if cursor.rowcount == esperadas and not cursor.warning_count:
+            return
+
+        cursor.execute("SHOW WARNINGS LIMIT 5")
+        detalle = '; '.join(f"{nivel} {codigo}: {mensaje}" for nivel, codigo, mensaje in cursor.fetchall())
+        raise Error(
+            f"El lote insertó {cursor.rowcount} de {esperadas} filas"
+            + (f" ({detalle})" if detalle else "")
+        )
+
+    @staticmethod
+    def _campo_load_data(valor):
+        # NULL sin comillas se lee como NULL; todo lo demás va entre comillas
+        if valor is None:
+            return 'NULL'
+        return '"' + str(valor).replace('"', '""') + '"'
@@ -0,0 +1,239 @@
+"""
+Perfilado estadístico bajo demanda para las peticiones de la aplicación web
+
+Cuando /realizar_venta se vuelve lento no basta con medir el tiempo total:
+hay que saber en qué parte del código Python (incluidas las llamadas a
+mysql.connector) se va ese tiempo.
+
+FUNCIONAMIENTO:
+- Un único hilo muestreador toma cada pocos milisegundos la pila del hilo
+  de cada petición perfilada (sys._current_frames). No instrumenta cada
+  llamada, por lo que el costo es bajo y solo existe mientras hay
+  peticiones perfiladas.
+- Las pilas se acumulan en formato "collapsed" (una línea por pila con su
+  número de muestras), que entienden flamegraph.pl, speedscope e inferno
+  para generar el flame graph.
+- Se activa por petición con la cabecera X-Profile: 1 (requiere token),
+  para un porcentaje aleatorio de peticiones (PROFILE_SAMPLE_RATE) o para
+  todas las peticiones durante una ventana de tiempo.
+- Las capturas se escriben en PROFILE_DIR y se listan/descargan desde
+  /_profiles, protegido con la cabecera X-Profile-Token. Solo se conservan
+  las PROFILE_MAX_ARCHIVOS capturas más recientes.
+"""
+
+import os
+import re
+import sys
+import hmac
+import time
+import random
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import g, request, jsonify, abort, send_from_directory
+
+
+class _Captura:
+    """
+    Muestras acumuladas de una petición
+    """
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.muestras = Counter()
+
+
+class RequestProfiler:
+    """
+    Perfilador muestreado de peticiones Flask
+    """
+
+    def __init__(self, directorio='profiles', intervalo=0.01, tasa_muestreo=0.0, token=None, max_archivos=200):
+        self.directorio = os.path.abspath(directorio)
+        self.max_archivos = max_archivos
+        self.intervalo = intervalo
+        self.tasa_muestreo = tasa_muestreo
+        self.token = token
+        self.ventana_hasta = 0.0
+
+        self._capturas = {}  # thread_id -> _Captura
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    @classmethod
+    def desde_entorno(cls):
+        return cls(
+            directorio=os.getenv('PROFILE_DIR', 'profiles'),
+            intervalo=float(os.getenv('PROFILE_INTERVAL_MS', 10)) / 1000,
+            tasa_muestreo=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+            token=os.getenv('PROFILE_TOKEN') or None,
+            max_archivos=int(os.getenv('PROFILE_MAX_ARCHIVOS', 200))
+        )
+
+    def registrar(self, app):
+        """
+        Conecta el perfilador a la aplicación y agrega los endpoints /_profiles
+        """
+        app.before_request(self._antes_de_peticion)
+        app.teardown_request(self._fin_de_peticion)
+
+        app.add_url_rule('/_profiles', 'listar_perfiles', self._listar)
+        app.add_url_rule('/_profiles/<nombre>', 'descargar_perfil', self._descargar)
+        app.add_url_rule('/_profiles/ventana', 'ventana_perfiles', self._abrir_ventana, methods=['POST'])
+
+    # ------------------------------------------------------------------
+    # Activación
+    # ------------------------------------------------------------------
+
+    def _token_valido(self):
+        recibido = request.headers.get('X-Profile-Token', '')
+        return self.token is not None and hmac.compare_digest(recibido, self.token)
+
+    def debe_perfilar(self):
+        if request.path.startswith('/_profiles'):
+            return False
+        if request.headers.get('X-Profile') == '1' and self._token_valido():
+            return True
+        if time.time() < self.ventana_hasta:
+            return True
+        return self.tasa_muestreo > 0 and random.random() < self.tasa_muestreo
+
+    def _antes_de_peticion(self):
+        if self.debe_perfilar():
+            g.perfil_thread_id = threading.get_ident()
+            self.iniciar_captura(g.perfil_thread_id, f"{request.method} {request.path}")
+
+    def _fin_de_peticion(self, error=None):
+        thread_id = g.pop('perfil_thread_id', None)
+        if thread_id is not None:
+            self.finalizar_captura(thread_id)
+
+    # ------------------------------------------------------------------
+    # Muestreo
+    # ------------------------------------------------------------------
+
+    def iniciar_captura(self, thread_id, nombre):
+        with self._lock:
+            self._capturas[thread_id] = _Captura(nombre)
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle_muestreo, name='request-profiler', daemon=True)
+                self._hilo.start()
+
+    def finalizar_captura(self, thread_id):
+        """
+        Detiene la captura del hilo y la escribe en disco
+
+        Returns:
+            str: Nombre del archivo generado (o None si no hubo muestras)
+        """
+        with self._lock:
+            captura = self._capturas.pop(thread_id, None)
+        if captura is None or not captura.muestras:
+            return None
+        return self._guardar(captura)
+
+    def _bucle_muestreo(self):
+        propio = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._capturas:
+                    self._hilo = None
+                    return
+                activos = list(self._capturas.items())
+
+            frames = sys._current_frames()
+            for thread_id, captura in activos:
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != propio:
+                    captura.muestras[self._colapsar(frame)] += 1
+            del frames
+
+            time.sleep(self.intervalo)
+
+    @staticmethod
+    def _colapsar(frame):
+        """
+        Convierte una pila en una línea "raiz;...;hoja" con módulo.función
+
+        Sin número de línea: así cada función es un solo cuadro del flame graph.
+        """
+        pila = []
+        while frame is not None:
+            modulo = frame.f_globals.get('__name__', '?')
+            pila.append(f"{modulo}.{frame.f_code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(pila))
+
+    def _guardar(self, captura):
+        os.makedirs(self.directorio, exist_ok=True)
+
+        duracion_ms = int((time.perf_counter() - captura.inicio) * 1000)
+        ruta_limpia = re.sub(r'[^A-Za-z0-9]+', '_', captura.nombre).strip('_')
+        nombre = f"{datetime.now():%Y%m%d_%H%M%S_%f}_{ruta_limpia}_{duracion_ms}ms.collapsed"
+
+        with open(os.path.join(self.directorio, nombre), 'w', encoding='utf-8') as archivo:
+            for pila, cantidad in captura.muestras.most_common():
+                archivo.write(f"{pila} {cantidad}\n")
+
+        self._rotar()
+        return nombre
+
+    def _rotar(self):
+        """
+        Borra las capturas más viejas cuando se supera max_archivos
+        """
+        with self._lock:
+            capturas = sorted(n for n in os.listdir(self.directorio) if n.endswith('.collapsed'))
+            # Los nombres empiezan con la fecha: el orden alfabético es cronológico
+            for nombre in capturas[:max(0, len(capturas) - self.max_archivos)]:
+                try:
+                    os.remove(os.path.join(self.directorio, nombre))
+                except FileNotFoundError:
+                    pass
+
+    # ------------------------------------------------------------------
+    # Endpoints protegidos
+    # ------------------------------------------------------------------
+
+    def _exigir_token(self):
+        # Sin token configurado los endpoints no existen
+        if self.token is None:
+            abort(404)
+        if not self._token_valido():
+            abort(403)
+
+    def _listar(self):
+        self._exigir_token()
+        if not os.path.isdir(self.directorio):
+            return jsonify([])
+
+        capturas = []
+        for nombre in sorted(os.listdir(self.directorio), reverse=True):
+            if nombre.endswith('.collapsed'):
+                ruta = os.path.join(self.directorio, nombre)
+                capturas.append({
+                    'nombre': nombre,
+                    'bytes': os.path.getsize(ruta),
+                    'creado': datetime.fromtimestamp(os.path.getmtime(ruta)).isoformat()
+                })
+        return jsonify(capturas)
+
+    def _descargar(self, nombre):
+        self._exigir_token()
+        return send_from_directory(self.directorio, nombre, as_attachment=True, mimetype='text/plain')
+
+    def _abrir_ventana(self):
+        """
+        Perfila todas las peticiones durante los próximos N segundos
+        """
+        self._exigir_token()
+        data = request.get_json(silent=True) or {}
+        try:
+            segundos = float(data.get('segundos', 60))
+        except (TypeError, ValueError):
+            segundos = None
+        if segundos is None or not 0 < segundos <= 3600:
+            return jsonify({"success": False, "error": "'segundos' debe ser un número entre 0 y 3600"}), 400
+        self.ventana_hasta = time.time() + segundos
+        return jsonify({"status": "success", "perfilando_hasta": datetime.fromtimestamp(self.ventana_hasta).isoformat()})
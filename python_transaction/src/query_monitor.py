@@ -0,0 +1,302 @@
+"""
+Captura de consultas lentas con EXPLAIN automático
+
+Los planes de ejecución de las consultas del servicio nunca se revisaron.
+Este módulo intercepta los cursores del servicio y, por cada sentencia
+normalizada (literales reemplazados por ?), registra:
+- número de llamadas
+- tiempo total, mínimo y máximo
+- histograma de latencias
+
+La primera vez que una sentencia supera el umbral (QUERY_SLOW_MS) se
+ejecuta una sola vez EXPLAIN sobre ella en una conexión propia del monitor
+a la misma base de datos donde corrió (la de su tienda con SHARD_MAP) y se
+registra el plan. Las estadísticas se guardan periódicamente en
+QUERY_STATS_FILE y reporte_consultas.py las ordena por tiempo total y
+marca los escaneos completos de tabla (type = ALL).
+"""
+
+import os
+import re
+import json
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from mysql.connector import Error
+from src.database import Database
+from src.admission import CircuitoAbiertoError
+
+# Límites superiores (ms) de los intervalos del histograma de latencias
+LIMITES_HISTOGRAMA_MS = [1, 5, 10, 50, 100, 500, 1000, 5000]
+
+SENTENCIAS_EXPLICABLES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def normalizar_sql(sql):
+    """
+    Deja la sentencia en una forma canónica para agrupar sus ejecuciones
+    """
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode('utf-8', errors='replace')
+    texto = ' '.join(sql.split())
+    texto = re.sub(r"'(?:[^'\\]|\\.)*'", '?', texto)
+    texto = re.sub(r'%s|%\(\w+\)s', '?', texto)
+    texto = re.sub(r'\b\d+(?:\.\d+)?\b', '?', texto)
+    texto = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?+)', texto)
+    return texto
+
+
+class EstadisticaConsulta:
+    """
+    Métricas acumuladas de una sentencia normalizada
+    """
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.llamadas = 0
+        self.total_ms = 0.0
+        self.minimo_ms = None
+        self.maximo_ms = 0.0
+        self.histograma = [0] * (len(LIMITES_HISTOGRAMA_MS) + 1)
+        self.plan = None
+        self.escaneo_completo = False
+        self.explicada = False
+
+    def agregar(self, duracion_ms):
+        self.llamadas += 1
+        self.total_ms += duracion_ms
+        self.minimo_ms = duracion_ms if self.minimo_ms is None else min(self.minimo_ms, duracion_ms)
+        self.maximo_ms = max(self.maximo_ms, duracion_ms)
+
+        for i, limite in enumerate(LIMITES_HISTOGRAMA_MS):
+            if duracion_ms <= limite:
+                self.histograma[i] += 1
+                break
+        else:
+            self.histograma[-1] += 1
+
+    def a_dict(self):
+        return {
+            'sql': self.sql,
+            'llamadas': self.llamadas,
+            'total_ms': round(self.total_ms, 3),
+            'minimo_ms': round(self.minimo_ms or 0.0, 3),
+            'maximo_ms': round(self.maximo_ms, 3),
+            'histograma': self.histograma,
+            'plan': self.plan,
+            'escaneo_completo': self.escaneo_completo
+        }
+
+
+class CursorInstrumentado:
+    """
+    Envoltura de un cursor de mysql.connector que mide cada execute()
+
+    Guarda el origen del cursor (tienda_id, None = base por defecto) para
+    que el EXPLAIN se ejecute sobre las mismas tablas.
+    """
+
+    def __init__(self, cursor, monitor, origen=None):
+        self._cursor = cursor
+        self._monitor = monitor
+        self._origen = origen
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._monitor.registrar(operation, params, time.perf_counter() - inicio, self._origen)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._monitor.registrar(operation, None, time.perf_counter() - inicio, self._origen)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+class QueryMonitor:
+    """
+    Registro de latencias por sentencia con EXPLAIN de las consultas lentas
+
+    El EXPLAIN se ejecuta en segundo plano con una base de datos propia del
+    monitor (nunca la del servicio), para no compartir ni agotar las
+    conexiones de las ventas en curso. Cada tienda registra la suya con
+    registrar_origen.
+    """
+
+    def __init__(self, umbral_ms=100, ruta_estadisticas='query_stats.json', intervalo_guardado=30, db=None):
+        self.umbral_ms = umbral_ms
+        self.ruta_estadisticas = ruta_estadisticas
+        self.intervalo_guardado = intervalo_guardado
+        self.db = db or Database()
+        self._bases_origen = {}  # tienda_id -> base dedicada al EXPLAIN
+
+        self._estadisticas = {}
+        self._lock = threading.Lock()
+        self._explicador = ThreadPoolExecutor(max_workers=1, thread_name_prefix='query-explain')
+        self._detener = threading.Event()
+
+    @classmethod
+    def desde_entorno(cls):
+        """
+        Crea el monitor si QUERY_MONITOR está activado, si no devuelve None
+        """
+        if os.getenv('QUERY_MONITOR', 'False').lower() != 'true':
+            return None
+        return cls(
+            umbral_ms=float(os.getenv('QUERY_SLOW_MS', 100)),
+            ruta_estadisticas=os.getenv('QUERY_STATS_FILE', 'query_stats.json')
+        )
+
+    def iniciar(self):
+        """
+        Guarda las estadísticas periódicamente y al terminar el proceso
+        """
+        hilo = threading.Thread(target=self._bucle_guardado, name='query-stats', daemon=True)
+        hilo.start()
+        atexit.register(self.guardar)
+
+    def registrar_origen(self, origen, db):
+        """
+        Base de datos dedicada al EXPLAIN de las consultas de una tienda
+        """
+        self._bases_origen[origen] = db
+
+    def envolver(self, cursor, origen=None):
+        return CursorInstrumentado(cursor, self, origen)
+
+    def registrar(self, sql, params, segundos, origen=None):
+        """
+        Acumula una ejecución y programa el EXPLAIN si es la primera vez que es lenta
+        """
+        normalizada = normalizar_sql(sql)
+        duracion_ms = segundos * 1000
+        explicar = False
+
+        with self._lock:
+            estadistica = self._estadisticas.get(normalizada)
+            if estadistica is None:
+                estadistica = self._estadisticas[normalizada] = EstadisticaConsulta(normalizada)
+            estadistica.agregar(duracion_ms)
+
+            if duracion_ms >= self.umbral_ms and not estadistica.explicada:
+                estadistica.explicada = True
+                explicar = normalizada.split(' ', 1)[0].upper() in SENTENCIAS_EXPLICABLES
+
+        if explicar:
+            print(f"🐢 Consulta lenta ({duracion_ms:.1f} ms): {normalizada}")
+            self._explicador.submit(self._explicar, estadistica, sql, params, origen)
+
+    def _explicar(self, estadistica, sql, params, origen):
+        db = self.db if origen is None else self._bases_origen.get(origen)
+        if db is None:
+            print(f"Sin base de datos para el EXPLAIN de la tienda {origen}")
+            return
+
+        connection = None
+        cursor = None
+
+        try:
+            connection = db.get_connection()
+            if not connection:
+                return
+            cursor = connection.cursor()
+            cursor.execute(f"EXPLAIN {sql}", params)
+            columnas = cursor.column_names
+            plan = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+            connection.commit()
+
+            with self._lock:
+                estadistica.plan = [{k: self._serializable(v) for k, v in fila.items()} for fila in plan]
+                estadistica.escaneo_completo = any(fila.get('type') == 'ALL' for fila in plan)
+
+            print(f"📝 EXPLAIN {estadistica.sql}")
+            for fila in estadistica.plan:
+                print(f"   tabla={fila.get('table')} type={fila.get('type')} "
+                      f"key={fila.get('key')} rows={fila.get('rows')} extra={fila.get('Extra')}")
+            if estadistica.escaneo_completo:
+                print("⚠️  Escaneo completo de tabla detectado")
+
+        except (Error, CircuitoAbiertoError) as e:
+            print(f"Error al ejecutar EXPLAIN: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                # Las bases de las tiendas usan pool: la conexión vuelve a él
+                liberar = getattr(db, 'liberar_conexion', None)
+                try:
+                    if liberar is not None:
+                        liberar(connection)
+                    else:
+                        connection.close()
+                except Error:
+                    pass
+
+    @staticmethod
+    def _serializable(valor):
+        if isinstance(valor, (bytes, bytearray)):
+            return valor.decode('utf-8', errors='replace')
+        if valor is None or isinstance(valor, (str, int, float)):
+            return valor
+        return str(valor)
+
+    def estadisticas(self):
+        with self._lock:
+            return [e.a_dict() for e in self._estadisticas.values()]
+
+    def guardar(self):
+        """
+        Escribe las estadísticas en QUERY_STATS_FILE (escritura atómica)
+        """
+        temporal = f"{self.ruta_estadisticas}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump({'limites_ms': LIMITES_HISTOGRAMA_MS, 'consultas': self.estadisticas()}, archivo, indent=2)
+        os.replace(temporal, self.ruta_estadisticas)
+
+    def _bucle_guardado(self):
+        while not self._detener.wait(self.intervalo_guardado):
+            self.guardar()
+
+
+def percentil_histograma(histograma, percentil):
+    """
+    Aproxima un percentil con el límite superior del intervalo que lo contiene
+    """
+    total = sum(histograma)
+    if total == 0:
+        return 0
+    objetivo = total * percentil / 100
+    acumulado = 0
+    for i, cantidad in enumerate(histograma):
+        acumulado += cantidad
+        if acumulado >= objetivo:
+            return LIMITES_HISTOGRAMA_MS[i] if i < len(LIMITES_HISTOGRAMA_MS) else float('inf')
+    return float('inf')
+
+
+def generar_reporte(consultas, limite=20):
+    """
+    Reporte en texto ordenado por tiempo total, con los escaneos completos marcados
+    """
+    ordenadas = sorted(consultas, key=lambda c: c['total_ms'], reverse=True)[:limite]
+    lineas = [f"{'TOTAL ms':>10} {'LLAMADAS':>9} {'PROM ms':>9} {'P95 ms':>8} {'MAX ms':>9}  SENTENCIA"]
+
+    for consulta in ordenadas:
+        promedio = consulta['total_ms'] / consulta['llamadas'] if consulta['llamadas'] else 0
+        p95 = percentil_histograma(consulta['histograma'], 95)
+        marca = "⚠️  FULL SCAN  " if consulta['escaneo_completo'] else ""
+        lineas.append(
+            f"{consulta['total_ms']:>10.1f} {consulta['llamadas']:>9} {promedio:>9.2f} "
+            f"{'<=' + str(p95):>8} {consulta['maximo_ms']:>9.1f}  {marca}{consulta['sql']}"
+        )
+    return '\n'.join(lineas)
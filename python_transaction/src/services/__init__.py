@@ -3,5 +3,11 @@ Archivo __init__.py para el paquete services
 """
 
 from .transaction_service import TransactionService
+from .stock_ledger import HotStockLedger
+from .stock_broadcaster import StockBroadcaster
+from .shard_router import ShardDatabase, ShardMap, ShardRouter
+from .outbox_relay import OutboxRelay, FileSink, HttpSink, QueueSink, metricas_combinadas
 
-__all__ = ['TransactionService']
+__all__ = ['TransactionService', 'HotStockLedger', 'StockBroadcaster',
+           'ShardDatabase', 'ShardMap', 'ShardRouter',
+           'OutboxRelay', 'FileSink', 'HttpSink', 'QueueSink', 'metricas_combinadas']
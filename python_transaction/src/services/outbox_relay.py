@@ -0,0 +1,446 @@
+"""
+Outbox transaccional para los eventos de venta
+
+Los sistemas externos (fidelización, contabilidad, reposición) necesitan
+enterarse de cada venta confirmada, pero avisarles dentro de
+realizar_venta_con_transaccion sumaría su latencia al checkout.
+
+PATRÓN OUTBOX:
+1. La transacción de la venta inserta el evento en outbox_eventos junto con
+   ventas y detalle_ventas: o se confirman los tres o ninguno.
+2. Un relay en segundo plano reclama un lote de eventos pendientes, en
+   orden de id, en una transacción corta (READ COMMITTED y FOR UPDATE SKIP
+   LOCKED): les asigna un plazo en reclamado_hasta y confirma enseguida.
+   Ningún bloqueo queda abierto mientras se habla con los sinks, así que
+   las inserciones del checkout nunca esperan al relay.
+3. El lote se publica en los destinos (sinks) configurados y solo después
+   de que todos lo aceptaron se marca como publicado. Si el proceso muere a
+   mitad, el reclamo vence y se retoma. La entrega es "al menos una vez" y
+   los consumidores deben descartar duplicados por id.
+4. Si un lote falla se libera sin cargarle el fallo a nadie y los
+   siguientes se publican de a un evento, hasta aislar el que falla. Ese
+   evento suma un intento y espera 1, 2, 4, ... segundos (hasta
+   OUTBOX_ESPERA_MAXIMA_SEGUNDOS) antes de reintentarse, sin frenar a los
+   que vienen detrás. Al llegar a OUTBOX_MAX_INTENTOS queda aparcado: no se
+   vuelve a intentar hasta que alguien lo corrija y ponga intentos = 0.
+   Un evento nunca se reclama mientras quede pendiente uno anterior de la
+   misma venta, así que esos eventos nunca se adelantan entre sí.
+
+Con SHARD_MAP cada tienda tiene su propia tabla outbox_eventos y su propio
+relay (ShardRouter.relays_outbox); todos comparten los mismos sinks. Los
+ids de venta y de evento son locales a cada tienda, por eso los eventos de
+una tienda llevan tienda_id y los consumidores deben descartar duplicados
+por (tienda_id, id).
+
+Sinks disponibles:
+- FileSink: agrega los eventos a un archivo NDJSON local.
+- HttpSink: POST JSON a un endpoint (ver outbox_stub.py para un stub local).
+- QueueSink: adaptador para una cola de mensajes; recibe una función
+  enviar(mensaje, clave) del cliente de la cola (Kafka, RabbitMQ, ...) y
+  usa la venta (tienda_id:venta_id) como clave para conservar su orden.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+import urllib.request
+from mysql.connector import Error
+from src.database import Database
+from src.admission import CircuitoAbiertoError
+
+
+class FileSink:
+    """
+    Publica los eventos en un archivo NDJSON local
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        # Los relays de todas las tiendas escriben en el mismo archivo
+        self._lock = threading.Lock()
+
+    def publicar(self, eventos):
+        with self._lock, open(self.ruta, 'a', encoding='utf-8') as archivo:
+            for evento in eventos:
+                archivo.write(json.dumps(evento) + '\n')
+            archivo.flush()
+            os.fsync(archivo.fileno())
+
+
+class HttpSink:
+    """
+    Publica cada lote con un POST JSON {"eventos": [...]}
+    """
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def publicar(self, eventos):
+        cuerpo = json.dumps({'eventos': eventos}).encode('utf-8')
+        peticion = urllib.request.Request(
+            self.url,
+            data=cuerpo,
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        # urlopen lanza HTTPError para respuestas 4xx/5xx
+        with urllib.request.urlopen(peticion, timeout=self.timeout):
+            pass
+
+
+class QueueSink:
+    """
+    Adaptador para colas de mensajes
+
+    Args:
+        enviar (callable): Función enviar(mensaje, clave) del cliente de la cola
+    """
+
+    def __init__(self, enviar):
+        self.enviar = enviar
+
+    def publicar(self, eventos):
+        for evento in eventos:
+            clave = str(evento['venta_id'])
+            if 'tienda_id' in evento:
+                clave = f"{evento['tienda_id']}:{clave}"
+            self.enviar(json.dumps(evento), clave)
+
+
+class OutboxRelay:
+    """
+    Lee outbox_eventos en lotes y publica los eventos pendientes
+
+    Args:
+        tienda_id (int): Tienda de la base de datos db, si es la de un shard
+    """
+
+    def __init__(self, sinks, db=None, tamano_lote=100, intervalo=1.0, segundos_reclamo=30, tienda_id=None,
+                 max_intentos=10, espera_maxima=300):
+        self.sinks = sinks
+        self.db = db or Database()
+        self.tienda_id = tienda_id
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        # Debe superar lo que tardan los sinks en publicar un lote
+        self.segundos_reclamo = segundos_reclamo
+        self.max_intentos = max_intentos
+        self.espera_maxima = espera_maxima
+        # Tras un lote fallido se publica de a un evento hasta el próximo éxito
+        self._aislando = False
+
+        self.publicados_total = 0
+        self.fallos_total = 0
+        self.ultimo_lote_ms = 0.0
+        self.ultimo_error = None
+        self._detener = threading.Event()
+        self._hilo = None
+
+    @classmethod
+    def desde_entorno(cls, db=None, sinks=None, tienda_id=None):
+        """
+        Crea el relay con la configuración OUTBOX_* del entorno
+
+        Args:
+            sinks (list): Sinks compartidos; por defecto los de OUTBOX_SINKS
+        """
+        return cls(
+            sinks if sinks is not None else cls.sinks_desde_entorno(),
+            db=db,
+            tamano_lote=int(os.getenv('OUTBOX_TAMANO_LOTE', 100)),
+            intervalo=float(os.getenv('OUTBOX_INTERVALO_SEGUNDOS', 1.0)),
+            segundos_reclamo=int(os.getenv('OUTBOX_RECLAMO_SEGUNDOS', 30)),
+            tienda_id=tienda_id,
+            max_intentos=int(os.getenv('OUTBOX_MAX_INTENTOS', 10)),
+            espera_maxima=int(os.getenv('OUTBOX_ESPERA_MAXIMA_SEGUNDOS', 300))
+        )
+
+    @staticmethod
+    def sinks_desde_entorno():
+        """
+        Crea los sinks de OUTBOX_SINKS (ej. "archivo,http")
+        """
+        sinks = []
+        for nombre in os.getenv('OUTBOX_SINKS', 'archivo').split(','):
+            nombre = nombre.strip()
+            if nombre == 'archivo':
+                sinks.append(FileSink(os.getenv('OUTBOX_ARCHIVO', 'outbox_eventos.ndjson')))
+            elif nombre == 'http':
+                sinks.append(HttpSink(os.getenv('OUTBOX_HTTP_URL', 'http://localhost:5001/eventos')))
+            elif nombre:
+                raise ValueError(f"Sink de outbox desconocido: {nombre}")
+        return sinks
+
+    def iniciar(self):
+        nombre = 'outbox-relay' if self.tienda_id is None else f"outbox-relay-tienda-{self.tienda_id}"
+        self._hilo = threading.Thread(target=self._bucle, name=nombre, daemon=True)
+        self._hilo.start()
+        atexit.register(self.detener)
+        origen = "base por defecto" if self.tienda_id is None else f"tienda {self.tienda_id}"
+        print(f"📤 Relay de outbox activo ({origen}) con {len(self.sinks)} sink(s)")
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo and self._hilo.is_alive():
+            self._hilo.join(timeout=5)
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                publicados = self.procesar_lote()
+            except Exception as e:
+                # Un fallo inesperado no debe detener la publicación
+                publicados = 0
+                self.ultimo_error = f"{type(e).__name__}: {e}"
+                print(f"❌ Error inesperado en el relay de outbox: {self.ultimo_error}")
+            # Si el lote vino lleno probablemente hay más pendientes: no esperar
+            if publicados < self.tamano_lote:
+                self._detener.wait(self.intervalo)
+
+    def procesar_lote(self):
+        """
+        Publica un lote de eventos pendientes
+
+        Reclama el lote, publica sin bloqueos abiertos y lo marca como
+        publicado. El reclamo evita que varios relays publiquen el mismo
+        lote a la vez.
+
+        Returns:
+            int: Número de eventos publicados
+        """
+        connection = None
+        cursor = None
+        inicio = time.perf_counter()
+
+        try:
+            connection = self.db.get_connection()
+            if not connection:
+                return 0
+
+            cursor = connection.cursor()
+            eventos = self._reclamar(connection, cursor, 1 if self._aislando else self.tamano_lote)
+            if not eventos:
+                return 0
+
+            ids = [evento['id'] for evento in eventos]
+            placeholders = ', '.join(['%s'] * len(ids))
+
+            try:
+                for sink in self.sinks:
+                    sink.publicar(eventos)
+            except Exception as e:
+                self.fallos_total += 1
+                self.ultimo_error = f"{type(e).__name__}: {e}"
+                print(f"❌ Error al publicar eventos de outbox: {self.ultimo_error}")
+                self._registrar_fallo(connection, cursor, ids)
+                return 0
+
+            cursor.execute(
+                f"""UPDATE outbox_eventos
+                    SET publicado_en = CURRENT_TIMESTAMP(3), reclamado_hasta = NULL
+                    WHERE id IN ({placeholders})""",
+                ids
+            )
+            connection.commit()
+
+            self._aislando = False
+            self.publicados_total += len(eventos)
+            self.ultimo_error = None
+            return len(eventos)
+
+        except Exception as e:
+            # Errores de base de datos, circuito abierto o filas inesperadas
+            self.ultimo_error = f"{type(e).__name__}: {e}"
+            print(f"❌ Error en el relay de outbox: {self.ultimo_error}")
+            if connection:
+                try:
+                    connection.rollback()
+                except Error:
+                    # Conexión perdida: el servidor ya descartó la transacción
+                    pass
+            return 0
+        finally:
+            self.ultimo_lote_ms = round((time.perf_counter() - inicio) * 1000, 1)
+            if cursor:
+                try:
+                    cursor.close()
+                except Error:
+                    pass
+            self._liberar_conexion(connection)
+
+    def _reclamar(self, connection, cursor, limite):
+        """
+        Reclama el siguiente lote de eventos pendientes y confirma de inmediato
+
+        READ COMMITTED evita los bloqueos de hueco de REPEATABLE READ sobre
+        el final del índice, donde el checkout inserta los eventos nuevos, y
+        SKIP LOCKED salta las filas que otro relay está reclamando. Se saltan
+        los eventos aparcados, los que esperan su próximo intento y los que
+        tienen pendiente un evento anterior de la misma venta.
+
+        Returns:
+            list: Eventos reclamados (vacía si no hay pendientes)
+        """
+        connection.start_transaction(isolation_level='READ COMMITTED')
+
+        cursor.execute(
+            """SELECT id, venta_id, tipo, payload, creado_en
+               FROM outbox_eventos
+               WHERE publicado_en IS NULL
+                 AND intentos < %s
+                 AND (reclamado_hasta IS NULL OR reclamado_hasta < CURRENT_TIMESTAMP(3))
+                 AND NOT EXISTS (
+                     SELECT 1 FROM outbox_eventos previo
+                     WHERE previo.venta_id = outbox_eventos.venta_id
+                       AND previo.id < outbox_eventos.id
+                       AND previo.publicado_en IS NULL
+                 )
+               ORDER BY id
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED""",
+            (self.max_intentos, limite)
+        )
+        filas = cursor.fetchall()
+        if not filas:
+            connection.commit()
+            return []
+
+        ids = [fila[0] for fila in filas]
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(
+            f"""UPDATE outbox_eventos
+                SET reclamado_hasta = CURRENT_TIMESTAMP(3) + INTERVAL %s SECOND
+                WHERE id IN ({placeholders})""",
+            [self.segundos_reclamo] + ids
+        )
+        connection.commit()
+
+        eventos = [
+            {
+                'id': fila[0],
+                'venta_id': fila[1],
+                'tipo': fila[2],
+                'payload': json.loads(fila[3]),
+                'creado_en': fila[4].isoformat()
+            }
+            for fila in filas
+        ]
+        if self.tienda_id is not None:
+            for evento in eventos:
+                evento['tienda_id'] = self.tienda_id
+        return eventos
+
+    def _registrar_fallo(self, connection, cursor, ids):
+        """
+        Libera un lote que los sinks rechazaron
+
+        Con varios eventos no se sabe cuál falló: se liberan sin sumar
+        intentos y se pasa a publicar de a uno. Un evento solo suma un
+        intento y espera 2^intentos segundos (con tope) antes de reintentarse.
+        """
+        placeholders = ', '.join(['%s'] * len(ids))
+        if len(ids) > 1:
+            cursor.execute(
+                f"UPDATE outbox_eventos SET reclamado_hasta = NULL WHERE id IN ({placeholders})",
+                ids
+            )
+            connection.commit()
+            self._aislando = True
+            return
+
+        # reclamado_hasta se calcula con el valor de intentos previo al incremento
+        cursor.execute(
+            """UPDATE outbox_eventos
+               SET reclamado_hasta = CURRENT_TIMESTAMP(3)
+                       + INTERVAL CAST(LEAST(POW(2, intentos), %s) AS UNSIGNED) SECOND,
+                   intentos = intentos + 1
+               WHERE id = %s""",
+            (self.espera_maxima, ids[0])
+        )
+        cursor.execute("SELECT intentos FROM outbox_eventos WHERE id = %s", (ids[0],))
+        intentos = cursor.fetchone()[0]
+        connection.commit()
+        if intentos >= self.max_intentos:
+            print(f"⚠️  Evento de outbox {ids[0]} aparcado tras {intentos} intentos fallidos")
+
+    def metricas(self):
+        """
+        Métricas de retraso del outbox
+
+        Returns:
+            dict: Pendientes, aparcados, antigüedad del pendiente más viejo y contadores
+        """
+        connection = None
+        cursor = None
+        pendientes = None
+        aparcados = None
+        lag_segundos = None
+
+        try:
+            connection = self.db.get_connection()
+            if not connection:
+                raise Error("No se pudo conectar a la base de datos")
+            cursor = connection.cursor()
+            cursor.execute(
+                """SELECT COALESCE(SUM(intentos < %s), 0),
+                          COALESCE(SUM(intentos >= %s), 0),
+                          TIMESTAMPDIFF(MICROSECOND,
+                                        MIN(CASE WHEN intentos < %s THEN creado_en END),
+                                        CURRENT_TIMESTAMP(3)) / 1000000
+                   FROM outbox_eventos
+                   WHERE publicado_en IS NULL""",
+                (self.max_intentos, self.max_intentos, self.max_intentos)
+            )
+            pendientes, aparcados, lag = cursor.fetchone()
+            pendientes, aparcados = int(pendientes), int(aparcados)
+            lag_segundos = float(lag) if lag is not None else 0.0
+            connection.commit()
+        except (Error, CircuitoAbiertoError) as e:
+            print(f"Error al obtener métricas del outbox: {e}")
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except Error:
+                    pass
+            self._liberar_conexion(connection)
+
+        return {
+            'tienda_id': self.tienda_id,
+            'pendientes': pendientes,
+            'aparcados': aparcados,
+            'lag_segundos': lag_segundos,
+            'publicados_total': self.publicados_total,
+            'fallos_total': self.fallos_total,
+            'ultimo_lote_ms': self.ultimo_lote_ms,
+            'ultimo_error': self.ultimo_error
+        }
+
+    def _liberar_conexion(self, connection):
+        """
+        Devuelve la conexión a su pool cuando la base de datos de la tienda usa uno
+        """
+        liberar = getattr(self.db, 'liberar_conexion', None)
+        if connection is not None and liberar is not None:
+            liberar(connection)
+
+
+def metricas_combinadas(relays):
+    """
+    Combina las métricas de los relays de la base por defecto y de las tiendas
+
+    Returns:
+        dict: Totales de todos los relays y el detalle de cada uno
+    """
+    detalle = [relay.metricas() for relay in relays]
+    return {
+        'pendientes': sum(m['pendientes'] or 0 for m in detalle),
+        'aparcados': sum(m['aparcados'] or 0 for m in detalle),
+        'lag_segundos': max((m['lag_segundos'] or 0.0 for m in detalle), default=0.0),
+        'publicados_total': sum(m['publicados_total'] for m in detalle),
+        'fallos_total': sum(m['fallos_total'] for m in detalle),
+        'relays': detalle
+    }
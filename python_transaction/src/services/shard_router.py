@@ -0,0 +1,310 @@
+"""
+Enrutamiento de tiendas a bases de datos independientes (sharding)
+
+Con muchas tiendas, un único esquema tienda_alimenticia en un único nodo
+MySQL limita tanto las escrituras como el almacenamiento. Aquí cada tienda
+tiene su propia base de datos (con las tablas productos, ventas y
+detalle_ventas) y el mapa de shards indica en qué nodo vive cada una.
+Para escalar se agregan nodos y se reparten las tiendas entre ellos.
+
+Formato del mapa (JSON, ruta en SHARD_MAP):
+
+    {
+        "nodos": {
+            "nodo1": {"host": "localhost", "port": 3306,
+                      "user": "root", "password": "12345",
+                      "pool_size": 5, "espera_pool": 5}
+        },
+        "tiendas": {
+            "1": {"nodo": "nodo1", "database": "tienda_1"},
+            "2": {"nodo": "nodo1", "database": "tienda_2"}
+        }
+    }
+
+Para probar en local basta con crear varias bases de datos en el mismo
+servidor ejecutando database_schema.sql con otro nombre de base de datos.
+
+Los reportes que abarcan varias tiendas se resuelven con scatter-gather:
+la misma consulta se lanza en paralelo a cada tienda y los resultados se
+combinan en Python.
+
+Con el outbox habilitado cada tienda necesita su propio relay, porque los
+eventos se escriben en la base de datos de la tienda (ver relays_outbox).
+
+Limitación: los servicios de las tiendas no usan el ledger de productos
+calientes (HOT_PRODUCTS); ese modo solo aplica a la base de datos por
+defecto.
+"""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from mysql.connector import Error, pooling
+from src.services.transaction_service import TransactionService
+from src.services.outbox_relay import OutboxRelay
+from src.admission import CircuitoAbiertoError
+
+
+class ShardDatabase:
+    """
+    Base de datos de una tienda con su propio pool de conexiones
+
+    Ofrece la misma interfaz que Database (get_connection, test_connection)
+    más liberar_conexion para devolver la conexión al pool.
+
+    El pool (que abre todas sus conexiones al crearse) se crea en el primer
+    uso: un nodo caído no impide arrancar la aplicación ni atender a las
+    demás tiendas, y se vuelve a intentar en la siguiente petición.
+    """
+
+    def __init__(self, tienda_id, host, port, database, user, password, pool_size=5, espera_pool=5,
+                 nombre_pool=None):
+        self.tienda_id = tienda_id
+        self.database = database
+        # MySQLConnectionPool no espera: falla apenas se agota. El semáforo
+        # hace que las peticiones esperen una conexión libre hasta espera_pool
+        self.espera_pool = espera_pool
+        self._disponibles = threading.BoundedSemaphore(pool_size)
+        self._configuracion_pool = {
+            'pool_name': nombre_pool or f"tienda_{tienda_id}",
+            'pool_size': pool_size,
+            'host': host,
+            'port': port,
+            'database': database,
+            'user': user,
+            'password': password
+        }
+        self.pool = None
+        self._pool_lock = threading.Lock()
+
+    def dedicada(self, pool_size=1):
+        """
+        Otra base de datos hacia la misma tienda con su propio pool
+
+        Para tareas de fondo (EXPLAIN) que no deben tomar conexiones de las ventas.
+        """
+        configuracion = self._configuracion_pool
+        return ShardDatabase(
+            self.tienda_id,
+            host=configuracion['host'],
+            port=configuracion['port'],
+            database=self.database,
+            user=configuracion['user'],
+            password=configuracion['password'],
+            pool_size=pool_size,
+            espera_pool=self.espera_pool,
+            nombre_pool=f"tienda_{self.tienda_id}_dedicada"
+        )
+
+    def _obtener_pool(self):
+        with self._pool_lock:
+            if self.pool is None:
+                self.pool = pooling.MySQLConnectionPool(**self._configuracion_pool)
+            return self.pool
+
+    def get_connection(self):
+        if not self._disponibles.acquire(timeout=self.espera_pool):
+            print(f"❌ Sin conexiones libres en el pool de la tienda {self.tienda_id}")
+            return None
+
+        try:
+            return self._obtener_pool().get_connection()
+        except Error as e:
+            self._disponibles.release()
+            print(f"❌ Error de conexión a la tienda {self.tienda_id}: {e}")
+            return None
+
+    def liberar_conexion(self, connection):
+        """
+        Devuelve la conexión al pool (close() en una conexión del pool no la cierra)
+        """
+        try:
+            connection.close()
+        finally:
+            self._disponibles.release()
+
+    def test_connection(self):
+        connection = self.get_connection()
+        if not connection:
+            return False
+        try:
+            return connection.is_connected()
+        finally:
+            self.liberar_conexion(connection)
+
+
+class ShardMap:
+    """
+    Mapa tienda -> base de datos, construido a partir del archivo JSON
+    """
+
+    def __init__(self, configuracion):
+        nodos = configuracion['nodos']
+        self.bases = {}
+
+        for tienda, destino in configuracion['tiendas'].items():
+            nodo = nodos[destino['nodo']]
+            tienda_id = int(tienda)
+            self.bases[tienda_id] = ShardDatabase(
+                tienda_id,
+                host=nodo.get('host', 'localhost'),
+                port=int(nodo.get('port', 3306)),
+                database=destino['database'],
+                user=nodo.get('user', 'root'),
+                password=nodo.get('password', ''),
+                pool_size=int(nodo.get('pool_size', 5)),
+                espera_pool=float(nodo.get('espera_pool', 5))
+            )
+
+    @classmethod
+    def desde_archivo(cls, ruta):
+        with open(ruta, encoding='utf-8') as archivo:
+            return cls(json.load(archivo))
+
+    def tiendas(self):
+        return sorted(self.bases)
+
+    def database(self, tienda_id):
+        try:
+            return self.bases[int(tienda_id)]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Tienda con ID {tienda_id} no existe en el mapa de shards")
+
+
+class ShardRouter:
+    """
+    Entrega el TransactionService de cada tienda y combina reportes entre tiendas
+
+    Args:
+        proteger (callable): Envuelve la base de cada tienda, por ejemplo con
+            su propio circuit breaker (AdmissionController.proteger)
+    """
+
+    def __init__(self, shard_map, broadcaster=None, query_monitor=None, outbox=False, proteger=None):
+        self.shard_map = shard_map
+        if query_monitor is not None:
+            for tienda_id in shard_map.tiendas():
+                query_monitor.registrar_origen(tienda_id, shard_map.database(tienda_id).dedicada(pool_size=1))
+        self.bases = {
+            tienda_id: proteger(shard_map.database(tienda_id)) if proteger else shard_map.database(tienda_id)
+            for tienda_id in shard_map.tiendas()
+        }
+        self.servicios = {
+            tienda_id: TransactionService(
+                broadcaster=broadcaster,
+                db=self.bases[tienda_id],
+                tienda_id=tienda_id,
+                query_monitor=query_monitor,
+                outbox=outbox
+            )
+            for tienda_id in shard_map.tiendas()
+        }
+
+    @classmethod
+    def desde_archivo(cls, ruta, broadcaster=None, query_monitor=None, outbox=False, proteger=None):
+        return cls(
+            ShardMap.desde_archivo(ruta),
+            broadcaster=broadcaster,
+            query_monitor=query_monitor,
+            outbox=outbox,
+            proteger=proteger
+        )
+
+    def relays_outbox(self, sinks):
+        """
+        Un relay de outbox por tienda, todos publicando en los mismos sinks
+        """
+        return [
+            OutboxRelay.desde_entorno(db=self.bases[tienda_id], sinks=sinks, tienda_id=tienda_id)
+            for tienda_id in self.shard_map.tiendas()
+        ]
+
+    def servicio(self, tienda_id):
+        """
+        Servicio de transacciones ligado a la base de datos de la tienda
+        """
+        try:
+            return self.servicios[int(tienda_id)]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Tienda con ID {tienda_id} no existe en el mapa de shards")
+
+    def reporte_ventas(self):
+        """
+        Reporte global de ventas mediante scatter-gather sobre todas las tiendas
+
+        Returns:
+            dict: Totales globales, totales por tienda y productos más vendidos
+        """
+        tiendas = self.shard_map.tiendas()
+        with ThreadPoolExecutor(max_workers=max(1, len(tiendas))) as executor:
+            parciales = list(executor.map(self._reporte_tienda, tiendas))
+
+        por_tienda = []
+        productos = {}
+        errores = []
+        for parcial in parciales:
+            if 'error' in parcial:
+                errores.append(parcial)
+                continue
+
+            por_tienda.append({
+                'tienda_id': parcial['tienda_id'],
+                'ventas': parcial['ventas'],
+                'total': float(parcial['total'])
+            })
+            # Los IDs de producto son locales a cada tienda: se combinan por nombre
+            for nombre, cantidad, importe in parcial['productos']:
+                acumulado = productos.setdefault(nombre, {'nombre': nombre, 'cantidad': 0, 'total': Decimal('0.00')})
+                acumulado['cantidad'] += int(cantidad)
+                acumulado['total'] += importe
+
+        mas_vendidos = sorted(productos.values(), key=lambda p: p['cantidad'], reverse=True)
+
+        return {
+            'ventas': sum(t['ventas'] for t in por_tienda),
+            'total': sum(t['total'] for t in por_tienda),
+            'por_tienda': por_tienda,
+            'productos_mas_vendidos': [
+                {'nombre': p['nombre'], 'cantidad': p['cantidad'], 'total': float(p['total'])}
+                for p in mas_vendidos[:10]
+            ],
+            'errores': errores
+        }
+
+    def _reporte_tienda(self, tienda_id):
+        db = self.bases[tienda_id]
+        connection = None
+        cursor = None
+
+        try:
+            connection = db.get_connection()
+            if not connection:
+                return {'tienda_id': tienda_id, 'error': "No se pudo conectar a la base de datos"}
+
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT COUNT(*), COALESCE(SUM(total), 0) FROM ventas WHERE estado = 'completada'"
+            )
+            ventas, total = cursor.fetchone()
+
+            cursor.execute(
+                """SELECT p.nombre, SUM(d.cantidad), SUM(d.subtotal)
+                   FROM detalle_ventas d
+                   JOIN ventas v ON v.id = d.venta_id
+                   JOIN productos p ON p.id = d.producto_id
+                   WHERE v.estado = 'completada'
+                   GROUP BY p.nombre"""
+            )
+            productos = cursor.fetchall()
+
+            return {'tienda_id': tienda_id, 'ventas': ventas, 'total': total, 'productos': productos}
+
+        except (Error, CircuitoAbiertoError) as e:
+            print(f"Error al obtener reporte de la tienda {tienda_id}: {e}")
+            return {'tienda_id': tienda_id, 'error': str(e)}
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                db.liberar_conexion(connection)
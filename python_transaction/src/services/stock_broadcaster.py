@@ -0,0 +1,172 @@
+"""
+Difusor en proceso de cambios de stock (Server-Sent Events)
+
+Cada venta confirmada publica un evento compacto con el nuevo stock de los
+productos afectados. Un único difusor reparte el evento a todos los
+navegadores suscritos, de modo que ningún cliente necesita recargar la
+lista completa de productos.
+
+Cada evento de stock lleva un número de secuencia (también como "id" del
+mensaje SSE). El cliente solo pide el estado completo (/productos) cuando
+detecta un hueco en la secuencia, y descarta los valores de un snapshot
+que sean más viejos que el último evento aplicado a cada producto.
+
+Las ventas publican después del commit, y dos ventas del mismo producto
+podrían publicar en orden inverso al de sus commits: el cliente vería
+primero el stock nuevo y luego el viejo. Por eso cada venta reserva un turno
+justo antes del commit (con los bloqueos de fila aún tomados) y el difusor
+entrega los eventos en orden de turno; el número de secuencia se asigna al
+entregar, así que sigue siendo contiguo.
+
+Cada suscriptor tiene una cola acotada. Si un consumidor es lento y su cola
+se llena, se descartan sus eventos pendientes y se le envía un mensaje
+"resync": el cliente vuelve a pedir /productos una sola vez en lugar de
+frenar a los demás suscriptores.
+"""
+
+import json
+import queue
+import threading
+
+
+class StockBroadcaster:
+    """
+    Reparte eventos de stock a muchos suscriptores
+    """
+
+    def __init__(self, tamano_cola=100):
+        self.tamano_cola = tamano_cola
+        # Número del último evento de stock publicado
+        self.secuencia = 0
+        self._suscriptores = set()
+        self._lock = threading.Lock()
+
+        # Turnos de publicación: orden de commit de las ventas
+        self._proximo_turno = 0
+        self._turno_a_entregar = 0
+        self._listos = {}  # turno -> evento (None si la venta no publicó nada)
+
+    def suscribir(self):
+        """
+        Registra un nuevo suscriptor y devuelve su cola de eventos
+        """
+        cola = queue.Queue(maxsize=self.tamano_cola)
+        with self._lock:
+            self._suscriptores.add(cola)
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self._suscriptores.discard(cola)
+
+    def total_suscriptores(self):
+        with self._lock:
+            return len(self._suscriptores)
+
+    def publicar(self, evento):
+        """
+        Envía un evento a todos los suscriptores sin bloquear nunca al emisor
+
+        Args:
+            evento (dict): Evento serializable a JSON con la clave 'tipo'
+        """
+        with self._lock:
+            self._entregar(evento)
+
+    def _entregar(self, evento):
+        # Requiere self._lock
+        if evento['tipo'] == 'stock':
+            self.secuencia += 1
+            evento['seq'] = self.secuencia
+        for cola in self._suscriptores:
+            try:
+                cola.put_nowait(evento)
+            except queue.Full:
+                # Consumidor lento: se vacía su cola y se le pide resincronizar
+                self._vaciar(cola)
+                cola.put_nowait({'tipo': 'resync'})
+
+    def reservar_turno(self):
+        """
+        Reserva el lugar de una venta en el orden de publicación
+
+        Debe llamarse justo antes del commit, con los bloqueos de fila aún
+        tomados, y completarse siempre con publicar_stock o cancelar_turno:
+        los turnos posteriores esperan a este.
+        """
+        with self._lock:
+            turno = self._proximo_turno
+            self._proximo_turno += 1
+            return turno
+
+    def cancelar_turno(self, turno):
+        """
+        Libera un turno cuya venta no llegó a publicar (rollback)
+        """
+        self._completar_turno(turno, None)
+
+    def _completar_turno(self, turno, evento):
+        with self._lock:
+            self._listos[turno] = evento
+            while self._turno_a_entregar in self._listos:
+                pendiente = self._listos.pop(self._turno_a_entregar)
+                self._turno_a_entregar += 1
+                if pendiente is not None:
+                    self._entregar(pendiente)
+
+    def publicar_stock(self, cambios, tienda_id=None, turno=None):
+        """
+        Publica los cambios de stock de una venta confirmada
+
+        Args:
+            cambios (list): Diccionarios con 'id', 'stock' y 'delta'
+            tienda_id (int): Tienda a la que pertenecen los productos (opcional)
+            turno (int): Turno reservado antes del commit (ver reservar_turno)
+        """
+        evento = None
+        if cambios:
+            evento = {'tipo': 'stock', 'productos': cambios}
+            if tienda_id is not None:
+                evento['tienda_id'] = tienda_id
+
+        if turno is not None:
+            self._completar_turno(turno, evento)
+        elif evento is not None:
+            self.publicar(evento)
+
+    def stream(self, intervalo_ping=15):
+        """
+        Generador de mensajes SSE para un suscriptor
+
+        Envía un comentario de "ping" cuando no hay eventos para mantener la
+        conexión abierta y detectar clientes desconectados.
+        """
+        cola = self.suscribir()
+        try:
+            # Secuencia actual: el cliente compara con la de su snapshot y
+            # solo resincroniza si se perdió algún evento
+            yield self._formatear({'tipo': 'inicio', 'seq': self.secuencia})
+            while True:
+                try:
+                    evento = cola.get(timeout=intervalo_ping)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield self._formatear(evento)
+        finally:
+            self.desuscribir(cola)
+
+    @staticmethod
+    def _formatear(evento):
+        mensaje = f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+        if 'seq' in evento and evento['tipo'] == 'stock':
+            mensaje = f"id: {evento['seq']}\n" + mensaje
+        return mensaje
+
+    @staticmethod
+    def _vaciar(cola):
+        try:
+            while True:
+                cola.get_nowait()
+        except queue.Empty:
+            pass
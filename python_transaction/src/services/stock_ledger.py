@@ -0,0 +1,417 @@
+"""
+Ledger de stock en memoria para productos "calientes" (hot SKUs)
+
+PROBLEMA:
+Durante una promoción miles de compradores atacan las mismas filas de
+`productos`. Cada venta hace UPDATE sobre la misma fila y queda en cola
+esperando el bloqueo de fila de InnoDB: una venta por cada bloqueo.
+
+SOLUCIÓN (opcional, solo para los productos configurados):
+- El stock se admite contra contadores en memoria repartidos en varios
+  shards, cada uno protegido por su propio lock.
+- La venta registra sus detalles con stock_aplicado = 0 y NO toca
+  productos.stock dentro de la transacción.
+- Un hilo de fondo descuenta el stock acumulado en lotes (write-behind) y
+  marca los detalles como aplicados en la MISMA transacción.
+- Al arrancar se reconcilia contra detalle_ventas: todo detalle confirmado
+  que quedó con stock_aplicado = 0 (por ejemplo por una caída) se descuenta
+  de productos.stock antes de cargar los contadores.
+- Tras cada lote se vuelve a leer productos.stock: los cambios hechos fuera
+  del ledger (reposiciones, importaciones, ajustes manuales) se suman o
+  restan a los contadores en el siguiente ciclo.
+
+IMPORTANTE: los contadores viven en la memoria del proceso. Este modo
+requiere que la aplicación corra en UN SOLO proceso; con varios procesos
+cada uno admitiría el stock completo y se vendería de más.
+"""
+
+import os
+import atexit
+import itertools
+import threading
+from mysql.connector import Error
+from src.database import Database
+from src.admission import CircuitoAbiertoError
+
+
+class _ShardStock:
+    """
+    Porción del stock de un producto protegida por su propio lock
+    """
+    __slots__ = ('lock', 'disponible')
+
+    def __init__(self, disponible):
+        self.lock = threading.Lock()
+        self.disponible = disponible
+
+
+class HotStockLedger:
+    """
+    Contador de stock en memoria con escritura diferida a la base de datos
+    """
+
+    def __init__(self, productos_calientes, num_shards=8, intervalo_flush=0.5, db=None):
+        self.productos_calientes = {int(p) for p in productos_calientes}
+        self.num_shards = max(1, int(num_shards))
+        self.intervalo_flush = intervalo_flush
+        self.db = db or Database()
+
+        self._shards = {}
+        # Stock que productos debería tener según el ledger (carga menos lotes escritos)
+        self._stock_bd = {}
+        # Reparto round-robin entre shards. threading.get_ident() no sirve:
+        # en Linux los idents son direcciones de pila y comparten los bits bajos
+        self._turno = itertools.count()
+        self._pendientes = []  # (detalle_id, producto_id, cantidad) ya confirmados
+        self._pendientes_lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    @classmethod
+    def desde_entorno(cls, db=None):
+        """
+        Crea el ledger a partir de HOT_PRODUCTS (ej. "1,3"). Devuelve None si
+        no hay productos calientes configurados.
+        """
+        valor = os.getenv('HOT_PRODUCTS', '').strip()
+        if not valor:
+            return None
+
+        productos = [int(p) for p in valor.split(',') if p.strip()]
+        return cls(
+            productos,
+            num_shards=int(os.getenv('HOT_STOCK_SHARDS', 8)),
+            intervalo_flush=float(os.getenv('HOT_STOCK_FLUSH_SEGUNDOS', 0.5)),
+            db=db
+        )
+
+    def es_caliente(self, producto_id):
+        try:
+            return int(producto_id) in self.productos_calientes
+        except (TypeError, ValueError):
+            return False
+
+    def iniciar(self):
+        """
+        Reconcilia, carga los contadores e inicia el hilo de escritura diferida
+        """
+        self.reconciliar()
+        self.cargar_stock()
+
+        self._hilo = threading.Thread(target=self._bucle_flush, name='hot-stock-flush', daemon=True)
+        self._hilo.start()
+        atexit.register(self.detener)
+        print(f"🔥 Ledger de stock caliente activo para productos: {sorted(self.productos_calientes)}")
+
+    def detener(self):
+        """
+        Detiene el hilo de fondo y escribe lo que quede pendiente
+        """
+        self._detener.set()
+        if self._hilo and self._hilo.is_alive():
+            self._hilo.join(timeout=5)
+        self.flush()
+
+    # ------------------------------------------------------------------
+    # Admisión de stock en memoria
+    # ------------------------------------------------------------------
+
+    def reservar(self, producto_id, cantidad):
+        """
+        Intenta reservar `cantidad` unidades. Devuelve True si se admitió.
+
+        Primero se intenta en el siguiente shard del turno (un solo lock). Si no
+        alcanza, se toman todos los locks del producto en orden fijo y se
+        descuenta del total, de modo que nunca se rechaza una venta que
+        cabe en el stock global.
+        """
+        shards = self._shards.get(int(producto_id))
+        if shards is None or cantidad <= 0:
+            return False
+
+        propio = shards[next(self._turno) % len(shards)]
+        with propio.lock:
+            if propio.disponible >= cantidad:
+                propio.disponible -= cantidad
+                return True
+
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            if sum(s.disponible for s in shards) < cantidad:
+                return False
+
+            restante = cantidad
+            for shard in shards:
+                tomado = min(shard.disponible, restante)
+                shard.disponible -= tomado
+                restante -= tomado
+                if restante == 0:
+                    break
+            return True
+        finally:
+            for shard in reversed(shards):
+                shard.lock.release()
+
+    def liberar(self, producto_id, cantidad):
+        """
+        Devuelve unidades reservadas por una venta que hizo rollback
+        """
+        shards = self._shards.get(int(producto_id))
+        if shards is None:
+            return
+
+        shard = shards[next(self._turno) % len(shards)]
+        with shard.lock:
+            shard.disponible += cantidad
+
+    def ajustar(self, producto_id, delta):
+        """
+        Suma (o resta) a los contadores un cambio de stock hecho fuera del ledger
+
+        Una resta mayor que lo disponible deja el producto en 0.
+        """
+        shards = self._shards.get(int(producto_id))
+        if shards is None or delta == 0:
+            return
+        if delta > 0:
+            self.liberar(producto_id, delta)
+            return
+
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            restante = -delta
+            for shard in shards:
+                tomado = min(shard.disponible, restante)
+                shard.disponible -= tomado
+                restante -= tomado
+        finally:
+            for shard in reversed(shards):
+                shard.lock.release()
+
+    def disponible(self, producto_id):
+        """
+        Stock disponible en memoria (lectura sin locks, aproximada)
+        """
+        shards = self._shards.get(int(producto_id))
+        if shards is None:
+            return None
+        return sum(s.disponible for s in shards)
+
+    def confirmar(self, detalles):
+        """
+        Registra detalles ya confirmados (commit) para descontarlos en el próximo lote
+
+        Args:
+            detalles (list): Tuplas (detalle_id, producto_id, cantidad)
+        """
+        if not detalles:
+            return
+        with self._pendientes_lock:
+            self._pendientes.extend(detalles)
+
+    # ------------------------------------------------------------------
+    # Sincronización con la base de datos
+    # ------------------------------------------------------------------
+
+    def reconciliar(self):
+        """
+        Aplica a productos.stock los detalles confirmados que nunca se escribieron
+
+        Debe ejecutarse al arrancar, antes de atender ventas.
+        """
+        connection = None
+        cursor = None
+
+        try:
+            connection = self.db.get_connection()
+            cursor = connection.cursor()
+            connection.start_transaction()
+
+            cursor.execute(
+                "SELECT producto_id, cantidad FROM detalle_ventas WHERE stock_aplicado = 0 FOR UPDATE"
+            )
+            totales = {}
+            for producto_id, cantidad in cursor.fetchall():
+                totales[producto_id] = totales.get(producto_id, 0) + cantidad
+
+            for producto_id in sorted(totales):
+                cursor.execute(
+                    "UPDATE productos SET stock = stock - %s WHERE id = %s",
+                    (totales[producto_id], producto_id)
+                )
+
+            cursor.execute("UPDATE detalle_ventas SET stock_aplicado = 1 WHERE stock_aplicado = 0")
+            connection.commit()
+
+            if totales:
+                print(f"🔁 Reconciliación de stock aplicada: {totales}")
+
+        except Error as e:
+            print(f"❌ Error en la reconciliación de stock: {e}")
+            if connection:
+                connection.rollback()
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+    def cargar_stock(self):
+        """
+        Carga el stock actual de los productos calientes y lo reparte en shards
+        """
+        if not self.productos_calientes:
+            return
+
+        connection = self.db.get_connection()
+        cursor = connection.cursor()
+        try:
+            ids = sorted(self.productos_calientes)
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"SELECT id, stock FROM productos WHERE id IN ({placeholders})", ids)
+            filas = cursor.fetchall()
+            connection.commit()  # Cerrar la instantánea de lectura
+        finally:
+            cursor.close()
+
+        for producto_id, stock in filas:
+            self._stock_bd[producto_id] = stock
+            base, resto = divmod(max(stock, 0), self.num_shards)
+            self._shards[producto_id] = [
+                _ShardStock(base + (1 if i < resto else 0)) for i in range(self.num_shards)
+            ]
+
+    def flush(self):
+        """
+        Escribe en un solo lote todos los descuentos pendientes
+
+        El descuento de stock y la marca stock_aplicado = 1 van en la misma
+        transacción, y solo se descuentan los detalles que siguen con
+        stock_aplicado = 0 al bloquearlos. Así reintentar un lote cuyo COMMIT
+        sí llegó al servidor (o que ya aplicó reconciliar) no descuenta dos veces.
+
+        Returns:
+            int: Número de detalles aplicados
+        """
+        with self._pendientes_lock:
+            lote, self._pendientes = self._pendientes, []
+        if not lote:
+            return 0
+
+        connection = None
+        cursor = None
+        aplicado = False
+
+        try:
+            connection = self.db.get_connection()
+            if not connection:
+                raise Error("No se pudo conectar a la base de datos")
+            cursor = connection.cursor()
+            connection.start_transaction()
+
+            ids = [detalle_id for detalle_id, _, _ in lote]
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(
+                f"""SELECT id, producto_id, cantidad FROM detalle_ventas
+                    WHERE id IN ({placeholders}) AND stock_aplicado = 0
+                    FOR UPDATE""",
+                ids
+            )
+            pendientes = cursor.fetchall()
+
+            totales = {}
+            for _, producto_id, cantidad in pendientes:
+                totales[producto_id] = totales.get(producto_id, 0) + cantidad
+
+            for producto_id in sorted(totales):
+                cursor.execute(
+                    "UPDATE productos SET stock = stock - %s WHERE id = %s",
+                    (totales[producto_id], producto_id)
+                )
+
+            if pendientes:
+                aplicar = [detalle_id for detalle_id, _, _ in pendientes]
+                placeholders = ', '.join(['%s'] * len(aplicar))
+                cursor.execute(
+                    f"UPDATE detalle_ventas SET stock_aplicado = 1 WHERE id IN ({placeholders})",
+                    aplicar
+                )
+
+            connection.commit()
+            aplicado = True
+            for producto_id, total in totales.items():
+                if producto_id in self._stock_bd:
+                    self._stock_bd[producto_id] -= total
+            return len(pendientes)
+
+        except (Error, CircuitoAbiertoError) as e:
+            print(f"❌ Error al escribir lote de stock caliente: {e}")
+            if connection:
+                try:
+                    connection.rollback()
+                except Error as error_rollback:
+                    # Conexión perdida: el servidor ya descartó la transacción
+                    print(f"❌ Error al hacer rollback del lote de stock caliente: {error_rollback}")
+            return 0
+        finally:
+            if not aplicado:
+                # Se reintenta en el siguiente ciclo (el flush es idempotente)
+                with self._pendientes_lock:
+                    self._pendientes[:0] = lote
+            if cursor:
+                try:
+                    cursor.close()
+                except Error:
+                    pass
+
+    def sincronizar_stock(self):
+        """
+        Aplica a los contadores los cambios de productos.stock hechos fuera del ledger
+
+        Compara el stock actual con el que debería haber según los lotes ya
+        escritos; la diferencia solo puede venir de otra fuente (reposición,
+        importar_datos.py, un UPDATE manual). Solo debe llamarse desde el hilo
+        de flush, después de flush().
+        """
+        if not self._stock_bd:
+            return
+
+        connection = None
+        cursor = None
+
+        try:
+            connection = self.db.get_connection()
+            if not connection:
+                raise Error("No se pudo conectar a la base de datos")
+            cursor = connection.cursor()
+            ids = sorted(self._stock_bd)
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"SELECT id, stock FROM productos WHERE id IN ({placeholders})", ids)
+            filas = cursor.fetchall()
+            connection.commit()  # Cerrar la instantánea de lectura
+        except (Error, CircuitoAbiertoError) as e:
+            print(f"❌ Error al releer el stock de productos calientes: {e}")
+            return
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except Error:
+                    pass
+
+        for producto_id, stock in filas:
+            delta = stock - self._stock_bd[producto_id]
+            if delta:
+                self._stock_bd[producto_id] = stock
+                self.ajustar(producto_id, delta)
+                print(f"🔁 Stock del producto {producto_id} cambiado fuera del ledger: {delta:+d}")
+
+    def _bucle_flush(self):
+        while not self._detener.wait(self.intervalo_flush):
+            try:
+                self.flush()
+                self.sincronizar_stock()
+            except Exception as e:
+                # Un fallo inesperado no debe detener la escritura diferida
+                print(f"❌ Error inesperado en el flush de stock caliente: {type(e).__name__}: {e}")
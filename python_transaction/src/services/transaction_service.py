@@ -13,9 +13,11 @@ Propiedades ACID:
 - Durabilidad: Los cambios persisten después del commit
 """
 
+import json
 import mysql.connector
 from mysql.connector import Error
 from src.database import Database
+from src.admission import CircuitoAbiertoError
 from src.models import Producto, Cliente, Venta, DetalleVenta
 from decimal import Decimal
 
@@ -25,8 +27,46 @@ class TransactionService:
     Implementa operaciones CRUD con control de transacciones
     """
     
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, stock_ledger=None, broadcaster=None, db=None, tienda_id=None, query_monitor=None,
+                 outbox=False):
+        # Con sharding cada tienda entrega su propia base de datos (ver shard_router.py)
+        self.db = db or Database()
+        self.tienda_id = tienda_id
+        # Ledger opcional para productos calientes (ver stock_ledger.py)
+        self.stock_ledger = stock_ledger
+        # Difusor opcional de cambios de stock (ver stock_broadcaster.py)
+        self.broadcaster = broadcaster
+        # Monitor opcional de latencia por sentencia (ver src/query_monitor.py)
+        self.query_monitor = query_monitor
+        # Registrar eventos de venta en outbox_eventos (ver outbox_relay.py)
+        self.outbox = outbox
+    
+    def _es_caliente(self, producto_id):
+        return self.stock_ledger is not None and self.stock_ledger.es_caliente(producto_id)
+    
+    def _cursor(self, connection):
+        """
+        Crea un cursor, instrumentado si el monitor de consultas está activo
+        """
+        cursor = connection.cursor()
+        if self.query_monitor is not None:
+            return self.query_monitor.envolver(cursor, self.tienda_id)
+        return cursor
+    
+    def _liberar_conexion(self, connection):
+        """
+        Devuelve la conexión a su pool cuando la base de datos de la tienda usa uno
+        """
+        liberar = getattr(self.db, 'liberar_conexion', None)
+        if connection is not None and liberar is not None:
+            liberar(connection)
+    
+    def _liberar_reservas(self, reservas):
+        """
+        Devuelve al ledger el stock admitido por una venta que no se confirmó
+        """
+        for producto_id, cantidad in reservas:
+            self.stock_ledger.liberar(producto_id, cantidad)
     
     def realizar_venta_con_transaccion(self, cliente_id, items_venta):
         """
@@ -50,6 +90,8 @@ class TransactionService:
         
         connection = None
         cursor = None
+        reservas = []  # Stock admitido en el ledger de productos calientes
+        turno = None  # Lugar de la venta en el orden de publicación de stock
         
         try:
             # Obtener conexión a la base de datos
@@ -59,7 +101,7 @@ class TransactionService:
             
             # INICIO DE TRANSACCIÓN
             # Crear cursor y deshabilitar autocommit para manejar transacciones manualmente
-            cursor = connection.cursor()
+            cursor = self._cursor(connection)
             connection.start_transaction()  # Equivale a BEGIN en SQL
             
             print("🚀 INICIANDO TRANSACCIÓN DE VENTA")
@@ -93,7 +135,18 @@ class TransactionService:
                     raise Exception(f"Producto con ID {producto_id} no existe")
                 
                 stock_actual = producto[3]
-                if stock_actual < cantidad_solicitada:
+                if self._es_caliente(producto_id):
+                    # Producto caliente: se admite contra el ledger en memoria,
+                    # sin esperar el bloqueo de la fila en productos
+                    if not self.stock_ledger.reservar(producto_id, cantidad_solicitada):
+                        raise Exception(
+                            f"Stock insuficiente para '{producto[1]}'. "
+                            f"Stock actual: {self.stock_ledger.disponible(producto_id)}, "
+                            f"Solicitado: {cantidad_solicitada}"
+                        )
+                    reservas.append((producto_id, cantidad_solicitada))
+                    stock_actual = self.stock_ledger.disponible(producto_id) + cantidad_solicitada
+                elif stock_actual < cantidad_solicitada:
                     raise Exception(
                         f"Stock insuficiente para '{producto[1]}'. "
                         f"Stock actual: {stock_actual}, Solicitado: {cantidad_solicitada}"
@@ -127,7 +180,29 @@ class TransactionService:
             print(f"📋 Venta registrada con ID: {venta_id}")
             
             # 4. REGISTRAR DETALLES DE VENTA Y ACTUALIZAR STOCK
+            detalles_calientes = []
+            cambios_stock = []
             for producto in productos_validados:
+                if self._es_caliente(producto['producto_id']):
+                    # El stock se descuenta después, en lote (write-behind)
+                    cursor.execute(
+                        """INSERT INTO detalle_ventas 
+                           (venta_id, producto_id, cantidad, precio_unitario, subtotal, stock_aplicado)
+                           VALUES (%s, %s, %s, %s, %s, 0)""",
+                        (venta_id, producto['producto_id'], producto['cantidad'],
+                         producto['precio_unitario'], producto['subtotal'])
+                    )
+                    detalles_calientes.append(
+                        (cursor.lastrowid, producto['producto_id'], producto['cantidad'])
+                    )
+                    cambios_stock.append({
+                        'id': producto['producto_id'],
+                        'stock': None,  # Se toma del ledger tras el commit
+                        'delta': -producto['cantidad']
+                    })
+                    print(f"🔥 Stock diferido para '{producto['nombre']}': -{producto['cantidad']}")
+                    continue
+                
                 # Insertar detalle de venta
                 cursor.execute(
                     """INSERT INTO detalle_ventas 
@@ -144,13 +219,59 @@ class TransactionService:
                     (nuevo_stock, producto['producto_id'])
                 )
                 
+                cambios_stock.append({
+                    'id': producto['producto_id'],
+                    'stock': nuevo_stock,
+                    'delta': -producto['cantidad']
+                })
+                
                 print(f"📦 Stock actualizado para '{producto['nombre']}': {producto['stock_actual']} → {nuevo_stock}")
             
+            # 4.1 REGISTRAR EL EVENTO DE VENTA EN EL OUTBOX (misma transacción)
+            if self.outbox:
+                evento = {
+                    'venta_id': venta_id,
+                    'cliente_id': cliente_id,
+                    'tienda_id': self.tienda_id,
+                    'total': str(total_venta),
+                    'productos': [
+                        {
+                            'producto_id': p['producto_id'],
+                            'cantidad': p['cantidad'],
+                            'precio_unitario': str(p['precio_unitario']),
+                            'subtotal': str(p['subtotal'])
+                        }
+                        for p in productos_validados
+                    ]
+                }
+                cursor.execute(
+                    "INSERT INTO outbox_eventos (venta_id, tipo, payload) VALUES (%s, %s, %s)",
+                    (venta_id, 'venta_completada', json.dumps(evento))
+                )
+                print("📨 Evento de venta registrado en el outbox")
+            
             # 5. COMMIT DE LA TRANSACCIÓN
+            # El turno se toma con los bloqueos de fila aún retenidos: una venta
+            # posterior del mismo producto no puede obtener un turno anterior
+            if self.broadcaster is not None:
+                turno = self.broadcaster.reservar_turno()
+            
             # Si llegamos aquí, todo salió bien, confirmamos los cambios
             connection.commit()
             print("✅ TRANSACCIÓN COMPLETADA EXITOSAMENTE - COMMIT REALIZADO")
             
+            if detalles_calientes:
+                self.stock_ledger.confirmar(detalles_calientes)
+            reservas = []
+            
+            # Notificar a los navegadores conectados (solo después del commit)
+            if self.broadcaster is not None:
+                for cambio in cambios_stock:
+                    if cambio['stock'] is None:
+                        cambio['stock'] = self.stock_ledger.disponible(cambio['id'])
+                self.broadcaster.publicar_stock(cambios_stock, tienda_id=self.tienda_id, turno=turno)
+                turno = None
+            
             return {
                 "success": True,
                 "venta_id": venta_id,
@@ -159,6 +280,10 @@ class TransactionService:
                 "productos": productos_validados
             }
             
+        except CircuitoAbiertoError:
+            # No es un fallo de la venta: la ruta responde 503 con Retry-After
+            raise
+            
         except Error as e:
             # Error de base de datos
             error_msg = f"Error de base de datos: {str(e)}"
@@ -166,6 +291,7 @@ class TransactionService:
             if connection:
                 connection.rollback()
                 print("🔄 ROLLBACK REALIZADO - Transacción deshecha")
+            self._liberar_reservas(reservas)
             return {"success": False, "error": error_msg}
             
         except Exception as e:
@@ -175,12 +301,17 @@ class TransactionService:
             if connection:
                 connection.rollback()
                 print("🔄 ROLLBACK REALIZADO - Transacción deshecha")
+            self._liberar_reservas(reservas)
             return {"success": False, "error": error_msg}
             
         finally:
+            # Un turno sin publicar bloquearía a las ventas siguientes
+            if turno is not None:
+                self.broadcaster.cancelar_turno(turno)
             # Limpiar recursos
             if cursor:
                 cursor.close()
+            self._liberar_conexion(connection)
             print("🧹 Recursos liberados")
     
     def simular_venta_con_error(self, cliente_id, items_venta):
@@ -200,7 +331,7 @@ class TransactionService:
             if not connection:
                 return {"success": False, "error": "No se pudo conectar a la base de datos"}
             
-            cursor = connection.cursor()
+            cursor = self._cursor(connection)
             connection.start_transaction()
             
             print("🚀 INICIANDO TRANSACCIÓN CON ERROR SIMULADO")
@@ -218,6 +349,9 @@ class TransactionService:
             print("💥 SIMULANDO ERROR...")
             raise Exception("Error simulado para demostrar rollback")
             
+        except CircuitoAbiertoError:
+            raise
+            
         except Exception as e:
             error_msg = f"Error simulado: {str(e)}"
             print(f"❌ {error_msg}")
@@ -229,19 +363,26 @@ class TransactionService:
         finally:
             if cursor:
                 cursor.close()
+            self._liberar_conexion(connection)
     
     def obtener_productos(self):
         """
         Obtiene la lista de productos disponibles
         """
+        connection = None
+        cursor = None
+        
         try:
             connection = self.db.get_connection()
-            cursor = connection.cursor()
+            if not connection:
+                print("Error al obtener productos: no se pudo conectar a la base de datos")
+                return []
+            cursor = self._cursor(connection)
             
             cursor.execute("SELECT id, nombre, categoria, precio, stock FROM productos WHERE stock > 0")
             productos = cursor.fetchall()
             
-            return [
+            resultado = [
                 {
                     'id': p[0],
                     'nombre': p[1], 
@@ -252,20 +393,37 @@ class TransactionService:
                 for p in productos
             ]
             
+            # Para productos calientes el stock vigente está en memoria
+            if self.stock_ledger is not None:
+                for producto in resultado:
+                    disponible = self.stock_ledger.disponible(producto['id'])
+                    if disponible is not None:
+                        producto['stock'] = disponible
+                resultado = [p for p in resultado if p['stock'] > 0]
+            
+            return resultado
+            
         except Error as e:
             print(f"Error al obtener productos: {e}")
             return []
         finally:
             if cursor:
                 cursor.close()
+            self._liberar_conexion(connection)
     
     def obtener_clientes(self):
         """
         Obtiene la lista de clientes
         """
+        connection = None
+        cursor = None
+        
         try:
             connection = self.db.get_connection()
-            cursor = connection.cursor()
+            if not connection:
+                print("Error al obtener clientes: no se pudo conectar a la base de datos")
+                return []
+            cursor = self._cursor(connection)
             
             cursor.execute("SELECT id, nombre, email FROM clientes")
             clientes = cursor.fetchall()
@@ -285,6 +443,7 @@ class TransactionService:
         finally:
             if cursor:
                 cursor.close()
+            self._liberar_conexion(connection)
     
     def verificar_rollback_real(self, cliente_id):
         """
@@ -306,7 +465,7 @@ class TransactionService:
             if not connection:
                 return {"success": False, "error": "No se pudo conectar a la base de datos"}
             
-            cursor = connection.cursor()
+            cursor = self._cursor(connection)
             
             # 1. CONTAR VENTAS ANTES DE LA TRANSACCIÓN
             cursor.execute("SELECT COUNT(*) FROM ventas")
@@ -361,3 +520,4 @@ class TransactionService:
         finally:
             if cursor:
                 cursor.close()
+            self._liberar_conexion(connection)
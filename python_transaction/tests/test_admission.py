@@ -0,0 +1,102 @@
+"""
+Pruebas del circuit breaker y del limitador adaptativo
+"""
+
+import unittest
+
+from src.admission import (
+    AdaptiveLimiter, AdmissionController, CircuitBreaker, CircuitoAbiertoError,
+    PRIORIDAD_ALTA, PRIORIDAD_BAJA
+)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_se_abre_al_llegar_al_umbral(self):
+        breaker = CircuitBreaker(umbral_fallos=3, segundos_abierto=60)
+        breaker.registrar_fallo()
+        breaker.registrar_fallo()
+        self.assertTrue(breaker.permite())
+
+        breaker.registrar_fallo()
+        self.assertEqual(breaker.estado, CircuitBreaker.ABIERTO)
+        self.assertFalse(breaker.permite())
+
+    def test_semiabierto_deja_pasar_una_sola_sonda(self):
+        breaker = CircuitBreaker(umbral_fallos=1, segundos_abierto=0)
+        breaker.registrar_fallo()
+
+        self.assertTrue(breaker.permite())
+        self.assertEqual(breaker.estado, CircuitBreaker.SEMIABIERTO)
+        self.assertFalse(breaker.permite())
+
+    def test_sonda_exitosa_cierra_el_circuito(self):
+        breaker = CircuitBreaker(umbral_fallos=1, segundos_abierto=0)
+        breaker.registrar_fallo()
+        breaker.permite()
+        breaker.registrar_exito()
+
+        self.assertEqual(breaker.estado, CircuitBreaker.CERRADO)
+        self.assertTrue(breaker.permite())
+        self.assertTrue(breaker.permite())
+
+    def test_sonda_fallida_vuelve_a_abrir(self):
+        breaker = CircuitBreaker(umbral_fallos=5, segundos_abierto=0)
+        for _ in range(5):
+            breaker.registrar_fallo()
+        breaker.permite()
+        breaker.segundos_abierto = 60
+        breaker.registrar_fallo()
+
+        self.assertEqual(breaker.estado, CircuitBreaker.ABIERTO)
+        self.assertFalse(breaker.permite())
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+
+    def test_reserva_cupo_para_prioridad_alta(self):
+        limiter = AdaptiveLimiter(limite_inicial=10, reserva_alta=0.2)
+        admitidas_bajas = sum(limiter.intentar_adquirir(PRIORIDAD_BAJA) for _ in range(10))
+        self.assertEqual(admitidas_bajas, 8)
+
+        self.assertTrue(limiter.intentar_adquirir(PRIORIDAD_ALTA))
+        self.assertTrue(limiter.intentar_adquirir(PRIORIDAD_ALTA))
+        self.assertFalse(limiter.intentar_adquirir(PRIORIDAD_ALTA))
+
+    def test_peticiones_lentas_concurrentes_reducen_una_vez(self):
+        limiter = AdaptiveLimiter(limite_inicial=20, latencia_objetivo=0.5)
+        for _ in range(10):
+            limiter.intentar_adquirir(PRIORIDAD_ALTA)
+        for _ in range(10):
+            limiter.liberar(latencia=2.0)
+
+        self.assertAlmostEqual(limiter.limite, 18.0)
+        self.assertEqual(limiter.en_curso, 0)
+
+    def test_rechazo_del_breaker_no_reduce_el_limite(self):
+        limiter = AdaptiveLimiter(limite_inicial=20)
+        admision = AdmissionController(limiter, CircuitBreaker())
+
+        @admision.controlar(PRIORIDAD_ALTA)
+        def vista():
+            raise CircuitoAbiertoError(5)
+
+        with self.assertRaises(CircuitoAbiertoError):
+            vista()
+        self.assertEqual(limiter.limite, 20.0)
+        self.assertEqual(limiter.en_curso, 0)
+
+    def test_breaker_principal_abierto_no_bloquea_otras_bases(self):
+        breaker = CircuitBreaker(umbral_fallos=1, segundos_abierto=60)
+        breaker.registrar_fallo()
+        admision = AdmissionController(AdaptiveLimiter(), breaker)
+
+        @admision.controlar(PRIORIDAD_ALTA)
+        def vista():
+            return 'ok'
+
+        self.assertEqual(vista(), 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Pruebas de la reanudación y la validación de esquema del cargador masivo
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from mysql.connector import Error
+from src.bulk_loader import BulkLoader
+
+
+class _CursorCarga:
+    """
+    Simula INSERT de varias filas sobre una tabla con clave primaria id
+    """
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.rowcount = 0
+        self.warning_count = 0
+
+    def execute(self, sql, params=None):
+        if sql.startswith('SHOW WARNINGS'):
+            return
+        columnas = sql[sql.index('(') + 1:sql.index(')')].split(', ')
+        filas = [dict(zip(columnas, params[i:i + len(columnas)])) for i in range(0, len(params), len(columnas))]
+        if any(fila['id'] in self.conexion.ids for fila in filas):
+            raise Error("Duplicate entry for key 'PRIMARY'")
+        self.conexion.ids.update(fila['id'] for fila in filas)
+        self.conexion.insertadas.extend(filas)
+        self.rowcount = len(filas)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class _ConexionCarga:
+    def __init__(self, ids=()):
+        self.ids = set(ids)
+        self.insertadas = []
+
+    def cursor(self):
+        return _CursorCarga(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class BulkLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        self.ruta = os.path.join(self.directorio.name, 'clientes.ndjson')
+
+    def _escribir(self, registros):
+        with open(self.ruta, 'w', encoding='utf-8') as archivo:
+            for registro in registros:
+                archivo.write(json.dumps(registro) + '\n')
+
+    def _cargador(self, conexion, **opciones):
+        cargador = BulkLoader('clientes', self.ruta, workers=1, **opciones)
+        cargador._conectar = lambda: conexion
+        return cargador
+
+    def test_reanudar_salta_solo_los_lotes_confirmados(self):
+        self._escribir([{'id': i, 'nombre': f"c{i}", 'email': f"c{i}@x"} for i in range(1, 9)])
+        with open(f"{self.ruta}.checkpoint.json", 'w', encoding='utf-8') as archivo:
+            json.dump({
+                'tabla': 'clientes',
+                'archivo': os.path.abspath(self.ruta),
+                'registros_confirmados': 2,
+                'lotes_terminados': [[4, 2]],
+                'completado': False
+            }, archivo)
+
+        # Los registros 3-4 y 7-8 nunca llegaron a confirmarse
+        conexion = _ConexionCarga(ids={1, 2, 5, 6})
+        cargador = self._cargador(conexion, tamano_lote=2)
+        cargador.cargar()
+
+        self.assertIsNone(cargador._error)
+        self.assertEqual(sorted(fila['id'] for fila in conexion.insertadas), [3, 4, 7, 8])
+        self.assertEqual(cargador.insertados, 4)
+        self.assertEqual(cargador.checkpoint.confirmados, 8)
+
+    def test_conflicto_de_clave_detiene_la_carga(self):
+        self._escribir([{'id': 1, 'nombre': 'Ana', 'email': 'ana@x'}])
+        conexion = _ConexionCarga(ids={1})
+        cargador = self._cargador(conexion)
+        with self.assertRaises(Error):
+            cargador.cargar()
+
+        self.assertEqual(cargador.insertados, 0)
+        self.assertEqual(cargador.checkpoint.confirmados, 0)
+
+    def test_claves_ausentes_en_el_primer_registro_no_se_pierden(self):
+        self._escribir([
+            {'id': 1, 'nombre': 'Ana', 'email': 'ana@x'},
+            {'id': 2, 'nombre': 'Luis', 'email': 'luis@x', 'telefono': '555'},
+        ])
+        conexion = _ConexionCarga()
+        self._cargador(conexion).cargar()
+
+        self.assertEqual(conexion.insertadas[0]['telefono'], None)
+        self.assertEqual(conexion.insertadas[1]['telefono'], '555')
+
+    def test_clave_desconocida_es_un_error(self):
+        self._escribir([{'id': 1, 'nombre': 'Ana', 'correo': 'ana@x'}])
+        with self.assertRaises(ValueError):
+            self._cargador(_ConexionCarga()).cargar()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Pruebas de los caminos de error del relay de outbox
+"""
+
+import datetime
+import unittest
+
+from mysql.connector import Error
+from src.services.outbox_relay import OutboxRelay
+
+
+class _CursorOutbox:
+    """
+    Devuelve los eventos pendientes al SELECT del reclamo y registra cada sentencia
+    """
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.ultima = ''
+
+    def execute(self, sql, params=None):
+        if self.conexion.caida:
+            raise Error("Lost connection to MySQL server during query")
+        self.ultima = ' '.join(sql.split())
+        self.conexion.sentencias.append((self.ultima, params))
+
+    def fetchall(self):
+        if self.ultima.startswith('SELECT id, venta_id'):
+            return self.conexion.filas
+        return []
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class _ConexionOutbox:
+    def __init__(self, filas, caida=False):
+        self.filas = filas
+        self.caida = caida
+        self.sentencias = []
+
+    def cursor(self):
+        return _CursorOutbox(self)
+
+    def start_transaction(self, **opciones):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        if self.caida:
+            raise Error("MySQL Connection not available")
+
+
+class _DatabaseOutbox:
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def get_connection(self):
+        return self.conexion
+
+
+class _SinkQueFalla:
+    def publicar(self, eventos):
+        raise OSError("HTTP Error 400: Bad Request")
+
+
+def _fila(evento_id, venta_id):
+    return (evento_id, venta_id, 'venta_completada', '{"total": "1.00"}', datetime.datetime(2024, 1, 1))
+
+
+class TestOutboxRelay(unittest.TestCase):
+
+    def test_conexion_perdida_no_escapa_del_lote(self):
+        relay = OutboxRelay([], db=_DatabaseOutbox(_ConexionOutbox([], caida=True)))
+
+        self.assertEqual(relay.procesar_lote(), 0)
+        self.assertIn("Lost connection", relay.ultimo_error)
+
+    def test_lote_fallido_se_libera_y_se_aisla_de_a_uno(self):
+        conexion = _ConexionOutbox([_fila(1, 10), _fila(2, 11)])
+        relay = OutboxRelay([_SinkQueFalla()], db=_DatabaseOutbox(conexion), tamano_lote=100)
+
+        self.assertEqual(relay.procesar_lote(), 0)
+        # Ningún evento del lote suma intentos: no se sabe cuál falló
+        liberacion = conexion.sentencias[-1][0]
+        self.assertTrue(liberacion.startswith("UPDATE outbox_eventos SET reclamado_hasta = NULL"))
+        self.assertNotIn("intentos = intentos + 1", liberacion)
+
+        conexion.sentencias.clear()
+        conexion.filas = [_fila(1, 10)]
+        relay.procesar_lote()
+        reclamo, params = conexion.sentencias[0]
+        self.assertEqual(params, (relay.max_intentos, 1))
+        self.assertTrue(any("intentos = intentos + 1" in sql for sql, _ in conexion.sentencias))
+        self.assertIn("HTTP Error 400", relay.ultimo_error)
+
+    def test_el_bucle_sobrevive_a_errores_inesperados(self):
+        relay = OutboxRelay([], db=_DatabaseOutbox(_ConexionOutbox([])))
+
+        def lote_roto():
+            relay._detener.set()
+            raise ValueError("payload inválido")
+
+        relay.procesar_lote = lote_roto
+        relay._bucle()
+
+        self.assertEqual(relay.ultimo_error, "ValueError: payload inválido")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Pruebas del enrutamiento por tienda y del reporte scatter-gather
+"""
+
+import unittest
+from decimal import Decimal
+
+from mysql.connector import Error
+from src.services.shard_router import ShardMap, ShardRouter
+
+
+class _CursorReporte:
+    def __init__(self, ventas, total, productos):
+        self.resumen = (ventas, total)
+        self.productos = productos
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchone(self):
+        return self.resumen
+
+    def fetchall(self):
+        return self.productos
+
+    def close(self):
+        pass
+
+
+class _ConexionReporte:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+class _DatabaseTienda:
+    """
+    Base de una tienda con los datos de su reporte; caida=True simula un nodo fuera de línea
+    """
+
+    def __init__(self, ventas=0, total=Decimal('0.00'), productos=(), caida=False):
+        self.cursor = _CursorReporte(ventas, total, list(productos))
+        self.caida = caida
+        self.liberadas = 0
+
+    def get_connection(self):
+        if self.caida:
+            raise Error("Can't connect to MySQL server")
+        return _ConexionReporte(self.cursor)
+
+    def liberar_conexion(self, connection):
+        self.liberadas += 1
+
+
+class _ShardMapFalso:
+    def __init__(self, bases):
+        self.bases = bases
+
+    def tiendas(self):
+        return sorted(self.bases)
+
+    def database(self, tienda_id):
+        return self.bases[int(tienda_id)]
+
+
+class TestShardRouter(unittest.TestCase):
+
+    def test_cada_tienda_usa_su_propia_base(self):
+        bases = {1: _DatabaseTienda(), 2: _DatabaseTienda()}
+        router = ShardRouter(_ShardMapFalso(bases))
+
+        self.assertIs(router.servicio(1).db, bases[1])
+        self.assertIs(router.servicio('2').db, bases[2])
+        self.assertEqual(router.servicio(2).tienda_id, 2)
+        with self.assertRaises(ValueError):
+            router.servicio(3)
+
+    def test_reporte_combina_tiendas_y_reporta_las_caidas(self):
+        bases = {
+            1: _DatabaseTienda(2, Decimal('10.00'), [('Arroz', 3, Decimal('7.50')), ('Sal', 1, Decimal('2.50'))]),
+            2: _DatabaseTienda(1, Decimal('5.00'), [('Arroz', 2, Decimal('5.00'))]),
+            3: _DatabaseTienda(caida=True)
+        }
+        reporte = ShardRouter(_ShardMapFalso(bases)).reporte_ventas()
+
+        self.assertEqual(reporte['ventas'], 3)
+        self.assertEqual(reporte['total'], 15.0)
+        self.assertEqual([t['tienda_id'] for t in reporte['por_tienda']], [1, 2])
+        self.assertEqual(reporte['productos_mas_vendidos'][0], {'nombre': 'Arroz', 'cantidad': 5, 'total': 12.5})
+        self.assertEqual([e['tienda_id'] for e in reporte['errores']], [3])
+        self.assertEqual(bases[1].liberadas, 1)
+
+    def test_el_mapa_no_conecta_al_crearse(self):
+        shard_map = ShardMap({
+            'nodos': {'nodo1': {'host': 'nodo-inexistente', 'pool_size': 2}},
+            'tiendas': {'1': {'nodo': 'nodo1', 'database': 'tienda_1'}}
+        })
+
+        self.assertEqual(shard_map.tiendas(), [1])
+        self.assertIsNone(shard_map.database(1).pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Pruebas del orden de publicación del difusor de stock
+"""
+
+import unittest
+
+from src.services.stock_broadcaster import StockBroadcaster
+
+
+class TestStockBroadcaster(unittest.TestCase):
+
+    def recibir(self, cola):
+        eventos = []
+        while not cola.empty():
+            eventos.append(cola.get_nowait())
+        return eventos
+
+    def test_eventos_se_entregan_en_orden_de_commit(self):
+        difusor = StockBroadcaster()
+        cola = difusor.suscribir()
+
+        turno_a = difusor.reservar_turno()
+        turno_b = difusor.reservar_turno()
+
+        # B publica antes que A: espera a que A termine
+        difusor.publicar_stock([{'id': 1, 'stock': 8, 'delta': -1}], turno=turno_b)
+        self.assertEqual(self.recibir(cola), [])
+
+        difusor.publicar_stock([{'id': 1, 'stock': 9, 'delta': -1}], turno=turno_a)
+        eventos = self.recibir(cola)
+
+        self.assertEqual([e['productos'][0]['stock'] for e in eventos], [9, 8])
+        self.assertEqual([e['seq'] for e in eventos], [1, 2])
+
+    def test_turno_cancelado_no_deja_huecos_en_la_secuencia(self):
+        difusor = StockBroadcaster()
+        cola = difusor.suscribir()
+
+        turno_a = difusor.reservar_turno()
+        turno_b = difusor.reservar_turno()
+        difusor.publicar_stock([{'id': 2, 'stock': 4, 'delta': -1}], turno=turno_b)
+        difusor.cancelar_turno(turno_a)
+
+        eventos = self.recibir(cola)
+        self.assertEqual([e['seq'] for e in eventos], [1])
+        self.assertEqual(difusor.secuencia, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
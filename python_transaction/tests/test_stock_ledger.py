@@ -0,0 +1,160 @@
+"""
+Pruebas del ledger de stock en memoria para productos calientes
+"""
+
+import threading
+import unittest
+
+from mysql.connector import Error
+from src.services.stock_ledger import HotStockLedger
+
+
+class _CursorFalso:
+    def __init__(self, filas):
+        self.filas = filas
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.filas
+
+    def close(self):
+        pass
+
+
+class _ConexionFalsa:
+    def __init__(self, filas):
+        self.filas = filas
+
+    def cursor(self):
+        return _CursorFalso(self.filas)
+
+    def commit(self):
+        pass
+
+
+class _DatabaseFalsa:
+    """
+    Devuelve el stock inicial de los productos para cargar_stock()
+    """
+
+    def __init__(self, filas):
+        self.filas = filas
+
+    def get_connection(self):
+        return _ConexionFalsa(self.filas)
+
+
+class _ConexionPerdida:
+    """
+    Conexión que se cae en medio del flush: execute y rollback fallan
+    """
+
+    def cursor(self):
+        return self
+
+    def start_transaction(self):
+        pass
+
+    def execute(self, sql, params=None):
+        raise Error("Lost connection to MySQL server during query")
+
+    def rollback(self):
+        raise Error("MySQL Connection not available")
+
+    def close(self):
+        raise Error("MySQL Connection not available")
+
+
+class _DatabaseCaida:
+    def get_connection(self):
+        return _ConexionPerdida()
+
+
+class TestHotStockLedger(unittest.TestCase):
+
+    def crear_ledger(self, stock=800, num_shards=8):
+        ledger = HotStockLedger([1], num_shards=num_shards, db=_DatabaseFalsa([(1, stock)]))
+        ledger.cargar_stock()
+        return ledger
+
+    def ejecutar_en_hilos(self, funcion, hilos=8):
+        trabajadores = [threading.Thread(target=funcion) for _ in range(hilos)]
+        for trabajador in trabajadores:
+            trabajador.start()
+        for trabajador in trabajadores:
+            trabajador.join()
+
+    def test_reservas_concurrentes_se_reparten_entre_shards(self):
+        ledger = self.crear_ledger()
+        admitidas = []
+
+        def comprar():
+            for _ in range(10):
+                admitidas.append(ledger.reservar(1, 1))
+
+        self.ejecutar_en_hilos(comprar)
+
+        self.assertTrue(all(admitidas))
+        self.assertEqual(ledger.disponible(1), 800 - 80)
+        # Ningún shard debe cargar con todas las reservas
+        por_shard = [100 - s.disponible for s in ledger._shards[1]]
+        self.assertEqual(sum(por_shard), 80)
+        self.assertEqual(por_shard.count(0), 0)
+
+    def test_liberar_conserva_el_stock_total(self):
+        ledger = self.crear_ledger()
+
+        def comprar_y_devolver():
+            for _ in range(10):
+                if ledger.reservar(1, 3):
+                    ledger.liberar(1, 3)
+
+        self.ejecutar_en_hilos(comprar_y_devolver)
+
+        self.assertEqual(ledger.disponible(1), 800)
+
+    def test_nunca_se_admite_mas_que_el_stock(self):
+        ledger = self.crear_ledger(stock=50)
+        admitidas = []
+
+        def comprar():
+            for _ in range(20):
+                admitidas.append(ledger.reservar(1, 1))
+
+        self.ejecutar_en_hilos(comprar)
+
+        self.assertEqual(admitidas.count(True), 50)
+        self.assertEqual(ledger.disponible(1), 0)
+
+    def test_cambios_de_stock_externos_llegan_a_los_contadores(self):
+        ledger = self.crear_ledger(stock=800)
+        self.assertTrue(ledger.reservar(1, 5))
+
+        # Reposición hecha fuera de la aplicación
+        ledger.db.filas[:] = [(1, 900)]
+        ledger.sincronizar_stock()
+        self.assertEqual(ledger.disponible(1), 795 + 100)
+
+        # Ajuste manual a la baja mayor que lo disponible: nunca negativo
+        ledger.db.filas[:] = [(1, -100)]
+        ledger.sincronizar_stock()
+        self.assertEqual(ledger.disponible(1), 0)
+
+    def test_flush_con_conexion_perdida_conserva_el_lote(self):
+        ledger = self.crear_ledger()
+        ledger.db = _DatabaseCaida()
+        ledger.confirmar([(10, 1, 2), (11, 1, 1)])
+
+        self.assertEqual(ledger.flush(), 0)
+        self.assertEqual(ledger._pendientes, [(10, 1, 2), (11, 1, 1)])
+
+        # Los detalles confirmados mientras tanto quedan detrás del lote fallido
+        ledger.confirmar([(12, 1, 1)])
+        self.assertEqual(ledger.flush(), 0)
+        self.assertEqual(ledger._pendientes, [(10, 1, 2), (11, 1, 1), (12, 1, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()